@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Subscription, VisualizationData
+from .models import Subscription, VisualizationData, ProcessingJob, StreamlitWorker, UploadSession, OptimizationResult
 
 class SubscriptionAdmin(admin.ModelAdmin):
     list_display = ('user', 'subscription_type', 'amount', 'taxes', 'total_amount', 'subscription_date', 'expiration_date')
@@ -10,8 +10,31 @@ admin.site.register(Subscription, SubscriptionAdmin)
 from .models import OptimizationData
 
 class OptimizationDataAdmin(admin.ModelAdmin):
-    list_display = ('user', 'upload_date', 'file')
+    list_display = ('user', 'upload_date', 'file', 'version', 'parent')
     search_fields = ('user__username', 'file')
 
 admin.site.register(OptimizationData, OptimizationDataAdmin)
-admin.site.register(VisualizationData)
\ No newline at end of file
+admin.site.register(VisualizationData)
+
+class ProcessingJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'optimization_data', 'kind', 'status', 'attempts', 'created_at', 'finished_at')
+    list_filter = ('status', 'kind')
+
+admin.site.register(ProcessingJob, ProcessingJobAdmin)
+
+class StreamlitWorkerAdmin(admin.ModelAdmin):
+    list_display = ('port', 'pid', 'status', 'restarts', 'started_at', 'last_health_check', 'last_routed_at')
+
+admin.site.register(StreamlitWorker, StreamlitWorkerAdmin)
+
+class UploadSessionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'filename', 'size', 'received', 'status', 'created_at')
+    list_filter = ('status',)
+
+admin.site.register(UploadSession, UploadSessionAdmin)
+
+class OptimizationResultAdmin(admin.ModelAdmin):
+    list_display = ('id', 'optimization_data', 'status', 'objective', 'baseline', 'created_at')
+    list_filter = ('status',)
+
+admin.site.register(OptimizationResult, OptimizationResultAdmin)
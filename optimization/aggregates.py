@@ -0,0 +1,136 @@
+import datetime
+import math
+from collections import Counter
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+RESERVOIR_SIZE = 10_000  # Values sampled per numeric column for approximate quartiles
+MAX_DISTINCT = 1_000  # Columns with more distinct values stop tracking value counts
+
+
+def json_value(value):
+    """Make a cell value JSON-safe; dates render as the charts label them."""
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if isinstance(value, datetime.datetime):
+        return value.strftime('%Y-%m-%d') if value.time() == datetime.time() else value.isoformat()
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return value.decode('utf-8', 'replace')
+    return value
+
+
+class NumericStats:
+    """count/mean/std/min/max/sum merged chunk by chunk (Chan et al.), plus a reservoir for quartiles."""
+
+    def __init__(self, seed=0):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.total = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.seen = 0
+        self.reservoir = np.empty(RESERVOIR_SIZE)
+        self.rng = np.random.default_rng(seed)
+
+    def update(self, values):
+        values = values[~np.isnan(values)]
+        n = len(values)
+        if not n:
+            return
+
+        chunk_mean = values.mean()
+        delta = chunk_mean - self.mean
+        combined = self.count + n
+        self.m2 += ((values - chunk_mean) ** 2).sum() + delta ** 2 * self.count * n / combined
+        self.mean += delta * n / combined
+        self.count = combined
+        self.total += values.sum()
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        self._sample(values)
+
+    def _sample(self, values):
+        # Vectorized Algorithm R: fill the reservoir, then replace slots at random
+        fill = max(0, min(RESERVOIR_SIZE - self.seen, len(values)))
+        self.reservoir[self.seen:self.seen + fill] = values[:fill]
+        rest = values[fill:]
+        if len(rest):
+            positions = self.seen + fill + np.arange(len(rest))
+            slots = self.rng.integers(0, positions + 1)
+            keep = slots < RESERVOIR_SIZE
+            self.reservoir[slots[keep]] = rest[keep]
+        self.seen += len(values)
+
+    def result(self):
+        if not self.count:
+            return {'count': 0}
+        sample = self.reservoir[:min(self.seen, RESERVOIR_SIZE)]
+        q25, q50, q75 = np.quantile(sample, [0.25, 0.5, 0.75])
+        return {
+            'count': self.count,
+            'mean': float(self.mean),
+            'std': float(np.sqrt(self.m2 / (self.count - 1))) if self.count > 1 else None,
+            'min': float(self.min),
+            '25%': float(q25),
+            '50%': float(q50),
+            '75%': float(q75),
+            'max': float(self.max),
+            'sum': float(self.total),
+        }
+
+
+class RunningSummary:
+    """Per-column describe() statistics and value counts accumulated over record batches.
+
+    Memory stays bounded by RESERVOIR_SIZE and MAX_DISTINCT per column, no
+    matter how many rows are fed in.
+    """
+
+    def __init__(self, schema):
+        self.schema = schema
+        self.rows = 0
+        self.numeric = {
+            field.name: NumericStats(seed=index)
+            for index, field in enumerate(schema)
+            if pa.types.is_integer(field.type) or pa.types.is_floating(field.type)
+        }
+        self.counts = {field.name: Counter() for field in schema}
+
+    def update(self, batch):
+        self.rows += batch.num_rows
+        for name, column in zip(batch.schema.names, batch.columns):
+            if name in self.numeric:
+                self.numeric[name].update(column.to_numpy(zero_copy_only=False).astype(float))
+
+            counter = self.counts.get(name)
+            if counter is None:
+                continue
+            for entry in pc.value_counts(column.drop_null()).to_pylist():
+                value = json_value(entry['values'])
+                if value is not None:
+                    counter[value] += entry['counts']
+            if len(counter) > MAX_DISTINCT:
+                self.counts[name] = None  # Too many distinct values to be worth tracking
+
+    def result(self):
+        return {
+            'rows': self.rows,
+            'describe': {name: stats.result() for name, stats in self.numeric.items()},
+            # Lists of [value, count] pairs keep non-string values JSON-safe
+            'value_counts': {
+                name: [[value, count] for value, count in counter.most_common()]
+                for name, counter in self.counts.items() if counter is not None
+            },
+        }
+
+
+def summarize_batches(schema, batches):
+    summary = RunningSummary(schema)
+    for batch in batches:
+        summary.update(batch)
+    return summary.result()
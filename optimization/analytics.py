@@ -0,0 +1,212 @@
+import os
+import shutil
+import threading
+
+import duckdb
+from django.conf import settings
+
+from .ingest import load_table
+
+ALL_MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+# Columns the dashboards filter on; tables are sorted by them so DuckDB's
+# zone maps can skip row groups instead of scanning the whole upload.
+FILTER_COLUMNS = ('Account', 'Year', 'Scenario', 'business_unit')
+
+# Dimensions of the pre-aggregated monthly cube, and the rollups built from it
+CUBE_DIMENSIONS = ('Scenario', 'business_unit', 'Account', 'Year')
+ROLLUPS = {
+    'rollup_unit': ('Account', 'Year', 'Scenario', 'business_unit'),
+    'rollup_account_year': ('Scenario', 'Account', 'Year'),
+    'rollup_month': ('Account', 'Year', 'month'),
+}
+
+# Bump when the tables built below change so older database files are rebuilt
+SCHEMA_VERSION = 3
+
+# One read-only connection per database file, kept for the life of the process
+_connections = {}
+_lock = threading.Lock()
+_build_locks = {}  # Upload id -> lock held while its database is built
+
+
+def database_path(optimization_data):
+    return os.path.join(settings.MEDIA_ROOT, settings.ANALYTICS_DIR, f'{optimization_data.content_hash}-v{SCHEMA_VERSION}.duckdb')
+
+
+def build_database(optimization_data):
+    """Materialise the upload's columnar data as a DuckDB database file."""
+    source = load_table(optimization_data)  # Also fills in content_hash
+    target = database_path(optimization_data)
+    if os.path.exists(target):
+        return target
+
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp_path = f'{target}.{os.getpid()}.{threading.get_ident()}.tmp'
+    stale = stale_partitions(optimization_data)
+    if stale is not None:
+        # Start from the previous version's database and keep its unchanged cube partitions
+        shutil.copyfile(database_path(optimization_data.parent), tmp_path)
+    con = duckdb.connect(tmp_path)
+    try:
+        for (table,) in con.execute("SELECT table_name FROM information_schema.tables WHERE table_name != 'monthly_cube'").fetchall():
+            con.execute(f'DROP TABLE "{table}"')
+        con.register('source', source)
+        order = [f'"{column}"' for column in FILTER_COLUMNS if column in source.column_names]
+        con.execute(f"CREATE TABLE data AS SELECT * FROM source {'ORDER BY ' + ', '.join(order) if order else ''}")
+        if 'Year' in source.column_names:
+            # Filters bind years as strings, as the dashboards always have
+            con.execute('ALTER TABLE data ALTER "Year" TYPE VARCHAR')
+        if set(CUBE_DIMENSIONS + tuple(ALL_MONTHS)) <= set(source.column_names):
+            if stale is None:
+                build_cube(con)
+            else:
+                update_cube(con, stale)
+            build_rollups(con)
+        # Every other sheet of the workbook gets its own table; blank sheets have no columns to hold
+        for sheet in optimization_data.sheets[1:]:
+            sheet_table = load_table(optimization_data, sheet['index'])
+            if not sheet_table.num_columns:
+                continue
+            con.register('sheet_source', sheet_table)
+            con.execute(f"CREATE TABLE sheet_{sheet['index']} AS SELECT * FROM sheet_source")
+            con.unregister('sheet_source')
+        con.execute('CHECKPOINT')
+    finally:
+        con.close()
+    os.replace(tmp_path, target)
+    return target
+
+
+def stale_partitions(optimization_data):
+    """Cube partitions to recompute from the parent version's database, or None for a full build."""
+    parent, changes = optimization_data.parent, optimization_data.changes
+    if parent is None or changes.get('keys') != list(CUBE_DIMENSIONS) or not os.path.exists(database_path(parent)):
+        return None
+    with duckdb.connect(database_path(parent), read_only=True) as con:
+        if not con.execute("SELECT 1 FROM information_schema.tables WHERE table_name = 'monthly_cube'").fetchall():
+            return None
+    return changes['added'] + changes['removed'] + changes['changed']
+
+
+def cube_query(where=''):
+    dimensions = ', '.join(CUBE_DIMENSIONS)
+    return f"""
+        SELECT {dimensions}, month, SUM(amount) AS amount, SUM(ABS(amount)) AS abs_amount
+        FROM (
+            UNPIVOT (SELECT {dimensions}, {','.join(ALL_MONTHS)} FROM data {where})
+            ON {','.join(ALL_MONTHS)}
+            INTO NAME month
+            VALUE amount
+        )
+        GROUP BY ALL
+        """
+
+
+def build_cube(con):
+    """Unpivot the month columns once into a long, pre-aggregated fact table."""
+    con.execute(f"CREATE TABLE monthly_cube AS {cube_query()} ORDER BY Account, Year, Scenario, business_unit")
+
+
+def update_cube(con, partitions):
+    """Recompute only the given partitions of a cube copied from the previous version."""
+    def in_stale(table):
+        return 'EXISTS (SELECT 1 FROM stale WHERE {})'.format(' AND '.join(
+            f'stale.{dimension} IS NOT DISTINCT FROM CAST({table}.{dimension} AS VARCHAR)' for dimension in CUBE_DIMENSIONS
+        ))
+
+    con.execute(f"CREATE TEMP TABLE stale ({', '.join(f'{dimension} VARCHAR' for dimension in CUBE_DIMENSIONS)})")
+    if partitions:
+        con.executemany(f"INSERT INTO stale VALUES ({', '.join('?' * len(CUBE_DIMENSIONS))})", partitions)
+    con.execute(f"DELETE FROM monthly_cube WHERE {in_stale('monthly_cube')}")
+    con.execute(f"INSERT INTO monthly_cube {cube_query('WHERE ' + in_stale('data'))}")
+    # Re-sort so the cube's zone maps stay as selective as after a full build
+    con.execute("CREATE TABLE sorted_cube AS SELECT * FROM monthly_cube ORDER BY Account, Year, Scenario, business_unit")
+    con.execute("DROP TABLE monthly_cube")
+    con.execute("ALTER TABLE sorted_cube RENAME TO monthly_cube")
+
+
+def build_rollups(con):
+    """Smaller rollups of the cube for the dashboards' coarser queries."""
+    for table, group_by in ROLLUPS.items():
+        columns = ', '.join(group_by)
+        con.execute(f"""
+            CREATE TABLE {table} AS
+            SELECT {columns}, SUM(amount) AS amount, SUM(abs_amount) AS abs_amount
+            FROM monthly_cube
+            GROUP BY {columns}
+            ORDER BY {columns}
+            """)
+
+
+def _build_lock(optimization_data):
+    with _lock:
+        return _build_locks.setdefault(optimization_data.pk, threading.Lock())
+
+
+def get_cursor(optimization_data):
+    """A thread-local cursor on the upload's persistent read-only connection."""
+    if not optimization_data.content_hash or not os.path.exists(database_path(optimization_data)):
+        # Builds are serialised per upload, so a lazy rebuild never stalls queries on other uploads
+        with _build_lock(optimization_data):
+            if not optimization_data.content_hash or not os.path.exists(database_path(optimization_data)):
+                build_database(optimization_data)
+    path = database_path(optimization_data)
+    with _lock:
+        con = _connections.get(path)
+        if con is None:
+            con = _connections[path] = duckdb.connect(path, read_only=True)
+    return con.cursor()
+
+
+def has_cube(optimization_data):
+    """Whether the upload has the finance layout the monthly cube is built from."""
+    tables = query(optimization_data, "SELECT table_name FROM information_schema.tables WHERE table_name = ?", ['monthly_cube'])
+    return not tables.empty
+
+
+def query(optimization_data, sql, params=()):
+    """Run a parameterized (prepared) query against an upload and return a DataFrame."""
+    return get_cursor(optimization_data).execute(sql, list(params)).df()
+
+
+def month_columns(value='amount'):
+    """Pivot long-format month rows back into one column per month."""
+    return ', '.join(f"SUM({value}) FILTER (WHERE month = '{month}') AS {month}" for month in ALL_MONTHS)
+
+
+def sales_by_business_unit(optimization_data, year='2023', account='Sales'):
+    return query(optimization_data, """
+        SELECT Scenario, business_unit, amount AS sales
+        FROM rollup_unit
+        WHERE Account = ? AND Year = ?
+        ORDER BY Scenario, business_unit
+        """, [account, year])
+
+
+def monthly_by_scenario(optimization_data, year='2023', account='Sales', business_unit='Software'):
+    return query(optimization_data, f"""
+        SELECT Scenario, {month_columns()}
+        FROM monthly_cube
+        WHERE Account = ? AND Year = ? AND business_unit = ?
+        GROUP BY Scenario
+        ORDER BY Scenario
+        """, [account, year, business_unit])
+
+
+def yearly_by_account(optimization_data, scenario='Actuals', exclude_account='Sales'):
+    return query(optimization_data, """
+        SELECT Account, Year, abs_amount AS sales
+        FROM rollup_account_year
+        WHERE Scenario = ? AND Account != ?
+        ORDER BY Account, Year
+        """, [scenario, exclude_account])
+
+
+def monthly_totals(optimization_data, year='2023', account='Sales'):
+    return query(optimization_data, f"""
+        SELECT {month_columns()}
+        FROM rollup_month
+        WHERE Account = ? AND Year = ?
+        HAVING COUNT(*) > 0
+        """, [account, year])
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class OptimizationConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'optimization'
+
+    def ready(self):
+        from . import signals  # noqa: F401 - registers the cache invalidation receivers
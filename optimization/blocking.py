@@ -0,0 +1,55 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+_executor = None
+
+
+def executor():
+    """Bounded thread pool for disk and CPU work done on behalf of async views."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.ASYNC_BLOCKING_WORKERS, thread_name_prefix='optimization-blocking')
+    return _executor
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Run func in the bounded pool without blocking the event loop.
+
+    func must not touch the ORM: pool threads don't manage database
+    connections, so queries belong in the async ORM or sync_to_async.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor(), functools.partial(func, *args, **kwargs))
+
+
+_exhausted = object()
+
+
+async def iterate_blocking(iterator):
+    """Async iterator over a blocking iterator, each next() running in the bounded pool.
+
+    Lets StreamingHttpResponse stream a sync generator under ASGI, where it
+    would otherwise collect the whole thing first. The same rule as
+    run_blocking applies: the iterator must not touch the ORM. Closing this
+    closes the iterator too, once a next() in flight has returned.
+    """
+    lock = threading.Lock()  # A generator can't be closed while another thread is running it
+
+    def step():
+        with lock:
+            return next(iterator, _exhausted)
+
+    def close():
+        with lock:
+            iterator.close()
+
+    try:
+        while (item := await run_blocking(step)) is not _exhausted:
+            yield item
+    finally:
+        if hasattr(iterator, 'close'):
+            executor().submit(close)
@@ -0,0 +1,55 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import Count, OuterRef, Subquery
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+
+from .entitlements import plan_cache_timeout
+from .models import Subscription
+
+DASHBOARD_CACHE_TIMEOUT = 10 * 60  # Seconds; signals invalidate sooner when something changes
+
+
+def dashboard_cache_key(user_id):
+    return f'dashboard-context:{user_id}'
+
+
+def load_dashboard_context(user_id):
+    """The user's current subscription and upload count in one query.
+
+    The current subscription is the active one expiring last, as in
+    entitlements.resolve_entitlements, so renewals (several rows per user)
+    resolve to the active plan rather than raising. Only plain values are
+    returned: the cached entry never holds the User row or its password hash.
+    """
+    latest = (
+        Subscription.objects
+        .filter(user=OuterRef('pk'), expiration_date__gte=timezone.now().date())
+        .order_by('-expiration_date', '-subscription_date')
+    )
+    row = get_object_or_404(
+        User.objects.annotate(
+            analysis_count=Count('optimizationdata'),
+            subscription_type=Subquery(latest.values('subscription_type')[:1]),
+            expiration_date=Subquery(latest.values('expiration_date')[:1]),
+        ).values('analysis_count', 'subscription_type', 'expiration_date'),
+        pk=user_id,
+    )
+    subscription = None
+    if row['subscription_type'] is not None:
+        subscription = {'subscription_type': row['subscription_type'], 'expiration_date': row['expiration_date']}
+    return {
+        'subscription': subscription,
+        'analysis_count': row['analysis_count'],
+    }
+
+
+def dashboard_context(user_id):
+    """Cached per user until the plan expires at the latest; signals.py drops the entry when a subscription or upload is saved."""
+    key = dashboard_cache_key(user_id)
+    context = cache.get(key)
+    if context is None:
+        context = load_dashboard_context(user_id)
+        expires = context['subscription'] and context['subscription']['expiration_date']
+        cache.set(key, context, plan_cache_timeout(DASHBOARD_CACHE_TIMEOUT, expires))
+    return context
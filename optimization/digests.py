@@ -0,0 +1,73 @@
+import ctypes
+import ctypes.util
+import hashlib
+
+
+class _SHA256Context(ctypes.Structure):
+    # OpenSSL's SHA256_CTX: a plain struct, so its bytes are the whole running state
+    _fields_ = [
+        ('h', ctypes.c_uint32 * 8),
+        ('Nl', ctypes.c_uint32),
+        ('Nh', ctypes.c_uint32),
+        ('data', ctypes.c_uint32 * 16),
+        ('num', ctypes.c_uint),
+        ('md_len', ctypes.c_uint),
+    ]
+
+
+STATE_SIZE = ctypes.sizeof(_SHA256Context)
+
+
+def _load_libcrypto():
+    name = ctypes.util.find_library('crypto')
+    if name is None:
+        return None
+    try:
+        lib = ctypes.CDLL(name)
+        functions = (lib.SHA256_Init, lib.SHA256_Update, lib.SHA256_Final)
+    except (OSError, AttributeError):
+        return None
+    for function in functions:
+        function.restype = ctypes.c_int
+    lib.SHA256_Init.argtypes = [ctypes.POINTER(_SHA256Context)]
+    lib.SHA256_Update.argtypes = [ctypes.POINTER(_SHA256Context), ctypes.c_char_p, ctypes.c_size_t]
+    lib.SHA256_Final.argtypes = [ctypes.c_char_p, ctypes.POINTER(_SHA256Context)]
+    return lib
+
+
+_libcrypto = _load_libcrypto()
+
+
+def resumable():
+    """Whether ResumableSHA256 can be used here (it needs OpenSSL's libcrypto)."""
+    return _libcrypto is not None
+
+
+class ResumableSHA256:
+    """SHA-256 whose running state can be saved and picked up again by another process.
+
+    hashlib objects can't be serialised, so this drives libcrypto's SHA256_*
+    functions directly; their context struct is the state. Digests are the
+    same as hashlib.sha256's.
+    """
+
+    def __init__(self, state=b''):
+        self.context = _SHA256Context()
+        if state:
+            if len(state) != STATE_SIZE:
+                raise ValueError('Not a SHA-256 state saved by this build')
+            ctypes.memmove(ctypes.addressof(self.context), state, STATE_SIZE)
+        else:
+            _libcrypto.SHA256_Init(ctypes.byref(self.context))
+
+    def update(self, data):
+        _libcrypto.SHA256_Update(ctypes.byref(self.context), bytes(data), len(data))
+
+    def state(self):
+        return ctypes.string_at(ctypes.addressof(self.context), STATE_SIZE)
+
+    def hexdigest(self):
+        context = _SHA256Context.from_buffer_copy(self.context)  # Finalising consumes the context
+        digest = ctypes.create_string_buffer(hashlib.sha256().digest_size)
+        _libcrypto.SHA256_Final(digest, ctypes.byref(context))
+        return digest.raw.hex()
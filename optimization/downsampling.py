@@ -0,0 +1,76 @@
+import numpy as np
+
+# Point budgets precomputed for long series; roughly one point per pixel of
+# chart width for small, medium and full-screen charts.
+RESOLUTION_LEVELS = (200, 800, 3200)
+
+
+def lttb_indices(y, n_out, x=None):
+    """Largest-Triangle-Three-Buckets: indices of the n_out most shape-preserving points.
+
+    Bucket averages are computed in one vectorized pass; the bucket walk itself
+    is inherently sequential (each pick depends on the previous one) so it loops
+    over buckets, never over rows.
+    """
+    y = np.asarray(y, dtype=float)
+    x = np.arange(len(y), dtype=float) if x is None else np.asarray(x, dtype=float)
+
+    # Missing values can't take part in the triangle areas
+    valid = np.flatnonzero(~np.isnan(y) & ~np.isnan(x))
+    n = len(valid)
+    if n_out >= n or n_out < 3:
+        return valid
+    x, y = x[valid], y[valid]
+
+    # n_out - 2 buckets between the fixed first and last points
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    counts = np.diff(edges)
+    avg_x = np.append(np.add.reduceat(x[1:-1], edges[:-1] - 1) / counts, x[-1])
+    avg_y = np.append(np.add.reduceat(y[1:-1], edges[:-1] - 1) / counts, y[-1])
+
+    selected = np.empty(n_out, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs(
+            (x[a] - avg_x[i + 1]) * (y[lo:hi] - y[a])
+            - (x[a] - x[lo:hi]) * (avg_y[i + 1] - y[a])
+        )
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return valid[selected]
+
+
+def minmax_indices(y, n_out):
+    """Indices of the minimum and maximum of each of n_out // 2 equal buckets.
+
+    Keeps every peak and trough visible, which suits bar and column charts.
+    """
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    n_buckets = n_out // 2
+    if n <= n_out or n_buckets < 1:
+        return np.arange(n)
+
+    edges = np.linspace(0, n, n_buckets + 1).astype(int)
+    bucket = np.repeat(np.arange(n_buckets), np.diff(edges))
+    picks = []
+    for reduce in (np.fmin, np.fmax):
+        extreme = reduce.reduceat(y, edges[:-1])
+        hits = np.flatnonzero(y == extreme[bucket])
+        # First hit per bucket; all-NaN buckets have no hits and drop out
+        _, first = np.unique(bucket[hits], return_index=True)
+        picks.append(hits[first])
+    return np.unique(np.concatenate(picks))
+
+
+def downsample_indices(y, n_out, mode='lttb'):
+    if mode == 'minmax':
+        return minmax_indices(y, n_out)
+    return lttb_indices(y, n_out)
+
+
+def resolution_levels(length):
+    """Resolution levels that actually reduce a series of the given length."""
+    return [level for level in RESOLUTION_LEVELS if level < length]
@@ -0,0 +1,57 @@
+import base64
+
+import numpy as np
+import pandas as pd
+
+# Numeric series at least this long are packed instead of stored as JSON lists
+COMPACT_MIN_LENGTH = 256
+
+ENCODING_KEY = '__encoding__'
+
+
+def encode_series(values):
+    """Encode a chart series for VisualizationData.data.
+
+    Long numeric series become base64 little-endian float64 blobs; anything
+    else stays a plain JSON list with missing values as null.
+    """
+    series = pd.Series(values)
+    if series.dtype.kind in 'biuf' and len(series) >= COMPACT_MIN_LENGTH:
+        packed = series.to_numpy(dtype='<f8', na_value=np.nan).tobytes()
+        return {
+            ENCODING_KEY: 'f8le',
+            'length': len(series),
+            'data': base64.b64encode(packed).decode('ascii'),
+        }
+    return series.astype(object).where(series.notna(), None).tolist()
+
+
+def encode_range(length):
+    """Encode the labels 0..length-1 without materialising them."""
+    return {ENCODING_KEY: 'range', 'length': length}
+
+
+def decode_array(value):
+    """Decode an encoded series to a NumPy array."""
+    if isinstance(value, dict) and value.get(ENCODING_KEY) == 'f8le':
+        return np.frombuffer(base64.b64decode(value['data']), dtype='<f8')
+    if isinstance(value, dict) and value.get(ENCODING_KEY) == 'range':
+        return np.arange(value['length'])
+    return np.asarray(value)
+
+
+def decode_series(value):
+    """Decode an encoded series back to a JSON-friendly list (NaN -> None)."""
+    if isinstance(value, dict) and ENCODING_KEY in value:
+        array = decode_array(value)
+        if array.dtype.kind == 'f':
+            values = array.astype(object)
+            values[np.isnan(array)] = None
+            return values.tolist()
+        return array.tolist()
+    return value
+
+
+def decode_payload(data):
+    """Decode every encoded series in a chart payload."""
+    return {key: decode_series(value) for key, value in data.items()}
@@ -0,0 +1,96 @@
+import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.defaultfilters import filesizeformat
+from django.utils import timezone
+
+from .models import ProcessingJob, Subscription
+
+DEFAULT_TIER = 'free'  # Users without an active subscription
+# Allowance for the multipart boundaries and form fields around an uploaded file
+UPLOAD_ENVELOPE_BYTES = 16 * 1024
+
+
+class QuotaExceeded(Exception):
+    def __init__(self, message, status=429):
+        super().__init__(message)
+        self.status = status
+
+
+def entitlement_cache_key(user_id):
+    return f'entitlements:{user_id}'
+
+
+def plan_cache_timeout(timeout, expires):
+    """Cache timeout capped at the end of a plan's expiration date, so expiry is never served stale."""
+    if expires is None:
+        return timeout
+    plan_end = timezone.make_aware(datetime.datetime.combine(expires + datetime.timedelta(days=1), datetime.time()))
+    return max(1, min(timeout, int((plan_end - timezone.now()).total_seconds())))
+
+
+def resolve_entitlements(user_id):
+    today = timezone.now().date()
+    subscription = (
+        Subscription.objects
+        .filter(user_id=user_id, expiration_date__gte=today)
+        .order_by('-expiration_date', '-subscription_date')
+        .values('subscription_type', 'expiration_date')
+        .first()
+    )
+    tier = subscription['subscription_type'] if subscription else DEFAULT_TIER
+    tiers = settings.ENTITLEMENT_TIERS
+    return {
+        'tier': tier,
+        'expires': subscription['expiration_date'] if subscription else None,
+        **tiers.get(tier, tiers[DEFAULT_TIER]),
+    }
+
+
+def entitlements_for(user_id):
+    """The user's tier and limits, cached until the TTL or the end of the plan, whichever is sooner.
+
+    signals.py drops the entry whenever one of the user's subscriptions changes.
+    """
+    key = entitlement_cache_key(user_id)
+    entitlements = cache.get(key)
+    if entitlements is None:
+        entitlements = resolve_entitlements(user_id)
+        cache.set(key, entitlements, plan_cache_timeout(settings.ENTITLEMENT_CACHE_TIMEOUT, entitlements['expires']))
+    return entitlements
+
+
+def check_queue(user_id):
+    """Admission control for a new background job; raises QuotaExceeded."""
+    entitlements = entitlements_for(user_id)
+    queued = ProcessingJob.objects.filter(optimization_data__user_id=user_id, status__in=['queued', 'running']).count()
+    if queued >= entitlements['max_queued_jobs']:
+        raise QuotaExceeded(f"The {entitlements['tier']} plan allows {entitlements['max_queued_jobs']} jobs in processing at once; try again when some finish")
+
+
+def check_upload(user_id, size):
+    """Admission control for a new upload of `size` bytes; raises QuotaExceeded."""
+    entitlements = entitlements_for(user_id)
+    if size > entitlements['max_upload_bytes']:
+        limit = filesizeformat(entitlements['max_upload_bytes'])
+        raise QuotaExceeded(f"Files on the {entitlements['tier']} plan are limited to {limit}", status=413)
+    check_queue(user_id)
+
+
+def check_upload_request(user_id, content_length):
+    """Admission control on a multipart upload's Content-Length, before its body is parsed; raises QuotaExceeded.
+
+    Only a body too large to hold an allowed file is refused, so the check
+    after parsing, on the file's real size, still applies.
+    """
+    check_upload(user_id, max(0, content_length - UPLOAD_ENVELOPE_BYTES))
+
+
+def sweep_limits(user_id):
+    """(scenarios, processes) one sweep may use on the user's plan, within the server-wide caps."""
+    entitlements = entitlements_for(user_id)
+    return (
+        min(entitlements['max_sweep_scenarios'], settings.SWEEP_MAX_SCENARIOS),
+        min(entitlements['max_sweep_workers'], settings.SWEEP_WORKERS),
+    )
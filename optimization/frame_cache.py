@@ -0,0 +1,54 @@
+import os
+import threading
+from collections import OrderedDict
+
+
+def frame_key(optimization_data):
+    """Cache key that changes whenever the upload's contents change."""
+    try:
+        mtime = os.path.getmtime(optimization_data.file.path)
+    except (OSError, ValueError):
+        mtime = None
+    return (optimization_data.id, optimization_data.content_hash, mtime)
+
+
+def frame_size(df):
+    return int(df.memory_usage(deep=True).sum())
+
+
+class FrameCache:
+    """Thread-safe LRU of parsed DataFrames, bounded by total memory rather than entry count."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._frames = OrderedDict()  # key -> (df, size)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._frames.get(key)
+            if entry is None:
+                return None
+            self._frames.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, df):
+        size = frame_size(df)
+        with self._lock:
+            if key in self._frames:
+                self.current_bytes -= self._frames.pop(key)[1]
+            if size > self.max_bytes:
+                return df  # Too big to cache at all; don't flush everything else for it
+            self._frames[key] = (df, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._frames.popitem(last=False)
+                self.current_bytes -= evicted_size
+        return df
+
+    def get_or_load(self, key, loader):
+        df = self.get(key)
+        if df is None:
+            df = self.put(key, loader())
+        return df
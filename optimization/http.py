@@ -0,0 +1,55 @@
+import gzip
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.utils.cache import patch_vary_headers
+
+from .blocking import run_blocking
+
+try:
+    import brotli
+except ImportError:  # Optional; responses fall back to gzip
+    brotli = None
+
+MIN_COMPRESS_BYTES = 200  # Smaller bodies aren't worth the CPU or the header overhead
+
+
+def compress_response(request, response):
+    """Brotli- or gzip-encode a response in place, based on Accept-Encoding."""
+    patch_vary_headers(response, ('Accept-Encoding',))
+    if (response.streaming or response.status_code != 200
+            or response.has_header('Content-Encoding') or len(response.content) < MIN_COMPRESS_BYTES):
+        return response
+
+    accepted = request.headers.get('Accept-Encoding', '')
+    if brotli is not None and 'br' in accepted:
+        encoding, body = 'br', brotli.compress(response.content)
+    elif 'gzip' in accepted:
+        encoding, body = 'gzip', gzip.compress(response.content, mtime=0)
+    else:
+        return response
+
+    response.content = body
+    response['Content-Length'] = str(len(body))
+    response['Content-Encoding'] = encoding
+    # The encoded bytes differ from the identity representation, so only a weak match holds
+    etag = response.get('ETag')
+    if etag and not etag.startswith('W/'):
+        response['ETag'] = f'W/{etag}'
+    return response
+
+
+def compressed(view_func):
+    """Compress a view's response; works on sync and async views."""
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def async_wrapper(request, *args, **kwargs):
+            response = await view_func(request, *args, **kwargs)
+            # Compressing a large payload is CPU work the event loop shouldn't wait on
+            return await run_blocking(compress_response, request, response)
+        return async_wrapper
+
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        return compress_response(request, view_func(request, *args, **kwargs))
+    return wrapper
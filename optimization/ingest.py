@@ -0,0 +1,384 @@
+import hashlib
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import duckdb
+import openpyxl
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+from django.conf import settings
+
+from .aggregates import RunningSummary, summarize_batches
+
+COLUMNAR_DIR = 'columnar'
+HASH_CHUNK_SIZE = 1024 * 1024
+# Leading bytes of each supported upload format; anything else that is text is read as CSV
+MAGIC_BYTES = (
+    (b'PK\x03\x04', 'xlsx'),
+    (b'PAR1', 'parquet'),
+    (b'\x1f\x8b', 'csv.gz'),
+)
+
+
+def file_sha256(path):
+    """Hash a file in fixed-size chunks so large uploads never sit in memory."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def sniff_format(head):
+    """Upload format from a file's first bytes, or None if it isn't one we can read."""
+    for magic, file_format in MAGIC_BYTES:
+        if head.startswith(magic):
+            return file_format
+    if b'\x00' in head:
+        return None  # Binary, but not a format we know
+    return 'csv'
+
+
+def file_format(path):
+    with open(path, 'rb') as fh:
+        return sniff_format(fh.read(8))
+
+
+def columnar_path(content_hash, sheet_index=0):
+    """Location of the Arrow IPC sidecar for one sheet of a given file content hash."""
+    name = f'{content_hash}.arrow' if sheet_index == 0 else f'{content_hash}.sheet{sheet_index}.arrow'
+    return os.path.join(settings.MEDIA_ROOT, COLUMNAR_DIR, name)
+
+
+def to_arrow(df):
+    """Convert a parsed sheet to an Arrow table, stringifying mixed-type columns."""
+    df.columns = [str(column) for column in df.columns]
+    try:
+        return pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Excel columns often mix numbers and text, which Arrow can't type
+        mixed = df.select_dtypes(include='object').columns
+        df[mixed] = df[mixed].astype('string')
+        return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def header_names(header):
+    """Column names the way pandas would label them (Unnamed: n, x.1 for duplicates)."""
+    names, seen = [], {}
+    for index, value in enumerate(header):
+        name = f'Unnamed: {index}' if value is None else str(value)
+        if name in seen:
+            seen[name] += 1
+            name = f'{name}.{seen[name]}'
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def sheet_names(path):
+    wb = openpyxl.load_workbook(path, read_only=True)
+    try:
+        return wb.sheetnames
+    finally:
+        wb.close()
+
+
+def iter_excel_chunks(path, chunk_size=None, sheet_index=0):
+    """Yield one sheet as DataFrames of at most chunk_size rows.
+
+    Uses openpyxl's read-only mode, which streams rows from the XML instead
+    of building the whole workbook in memory.
+    """
+    chunk_size = chunk_size or settings.INGEST_CHUNK_ROWS
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = wb.worksheets[sheet_index].iter_rows(values_only=True)
+        header = list(next(rows, ()))
+        while header and header[-1] is None:
+            header.pop()  # Trailing unlabeled columns, which pandas also drops
+        columns = header_names(header)
+        width = len(columns)
+        blank = (None,) * width
+
+        batch, pending_blank, chunks = [], 0, 0
+        for row in rows:
+            row = tuple(row[:width]) + (None,) * (width - len(row))
+            if row == blank:
+                pending_blank += 1  # Only kept if more data follows, like pandas
+                continue
+            batch.extend([blank] * pending_blank)
+            pending_blank = 0
+            batch.append(row)
+            if len(batch) >= chunk_size:
+                yield pd.DataFrame.from_records(batch, columns=columns)
+                batch, chunks = [], chunks + 1
+        if batch or not chunks:
+            yield pd.DataFrame.from_records(batch, columns=columns)  # A sheet with no rows is still one chunk
+    finally:
+        wb.close()
+
+
+def infer_types(df):
+    """Apply pandas.read_excel's type rules to a raw chunk.
+
+    Numeric text becomes numbers, and float columns holding only whole
+    numbers become integers.
+    """
+    for name in df.columns:
+        column = df[name]
+        if column.dtype == object:
+            try:
+                column = pd.to_numeric(column)
+            except (ValueError, TypeError):
+                continue
+        if column.dtype.kind == 'f' and column.notna().all() and (column == column.round()).all():
+            column = column.astype('int64')
+        df[name] = column
+    return df
+
+
+def widen(left, right):
+    """Narrowest type that holds values of both types; text when nothing narrower does."""
+    if left == right:
+        return left
+    try:
+        unified = pa.unify_schemas([pa.schema([('v', left)]), pa.schema([('v', right)])], promote_options='permissive')
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        return pa.string()  # e.g. numbers in one chunk and text in another
+    return unified.field('v').type
+
+
+def widen_schema(schema, other):
+    """Field by field, a schema whose types hold the values of both schemas."""
+    return pa.schema([field.with_type(widen(field.type, other.field(field.name).type)) for field in schema])
+
+
+def infer_schema(schema):
+    """Final schema of a sheet; columns that were empty throughout fall back to text."""
+    return pa.schema([
+        field.with_type(pa.string()) if pa.types.is_null(field.type) else field
+        for field in schema
+    ])
+
+
+def write_batches(target, schema, batches, on_batch=None):
+    """Write record batches to an Arrow IPC file, summarising as it goes.
+
+    Peak memory is one batch plus the bounded running aggregates, however
+    large the input is. on_batch(rows) is called after each batch is written.
+    """
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    # Unique per call: threads ingesting the same bytes must not write one temp file
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.tmp')
+    os.close(fd)
+    summary = RunningSummary(schema)
+    try:
+        with pa.ipc.new_file(tmp_path, schema) as writer:
+            for batch in batches:
+                writer.write_batch(batch)
+                summary.update(batch)
+                if on_batch is not None:
+                    on_batch(batch.num_rows)
+        os.replace(tmp_path, target)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return summary.result()
+
+
+def stream_excel_to_arrow(source, target, sheet_index=0, on_batch=None):
+    """Convert one sheet to an Arrow IPC file chunk by chunk.
+
+    Each chunk is typed on its own and spooled to disk while the sheet's
+    schema is widened to fit all of them (integers that meet fractions become
+    floats, numbers that meet text become text). The spooled chunks are then
+    cast to that schema, so a later chunk never loses values to the types of
+    an earlier one.
+    """
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(target)) as spool:
+        paths, schema = [], None
+        for df in iter_excel_chunks(source, sheet_index=sheet_index):
+            table = to_arrow(infer_types(df))
+            schema = table.schema if schema is None else widen_schema(schema, table.schema)
+            paths.append(os.path.join(spool, f'{len(paths)}.arrow'))
+            feather.write_feather(table, paths[-1], compression='uncompressed')
+
+        schema = infer_schema(schema)
+        batches = (
+            batch
+            for path in paths
+            for batch in feather.read_table(path, memory_map=True).cast(schema).to_batches()
+        )
+        return write_batches(target, schema, batches, on_batch)
+
+
+def stream_native_to_arrow(source, target, source_format, on_batch=None):
+    """Convert a CSV (optionally gzipped) or Parquet upload with a native columnar reader."""
+    if source_format == 'parquet':
+        parquet = pq.ParquetFile(source)
+        return write_batches(target, parquet.schema_arrow, parquet.iter_batches(batch_size=settings.INGEST_CHUNK_ROWS), on_batch)
+
+    compression = 'gzip' if source_format == 'csv.gz' else 'none'
+    con = duckdb.connect()
+    try:
+        reader = con.execute(
+            'SELECT * FROM read_csv_auto(?, compression = ?)', [source, compression]
+        ).fetch_record_batch(settings.INGEST_CHUNK_ROWS)
+        return write_batches(target, reader.schema, reader, on_batch)
+    finally:
+        con.close()
+
+
+def parse_sheets(source, pending, on_batch=None, on_sheet=None):
+    """Stream each (sheet_index, target) pair to Arrow, in parallel when there are several.
+
+    openpyxl parsing is CPU-bound pure Python, so sheets go to separate
+    processes rather than threads. Returns {sheet_index: summary}.
+    """
+    workers = min(settings.INGEST_WORKERS, len(pending))
+    summaries = {}
+    if workers <= 1:
+        for index, target in pending:
+            summaries[index] = stream_excel_to_arrow(source, target, index, on_batch)
+            if on_sheet is not None:
+                on_sheet()
+        return summaries
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(stream_excel_to_arrow, source, target, index): index for index, target in pending}
+        for future in as_completed(futures):
+            summaries[futures[future]] = summary = future.result()
+            # Rows parsed in another process are only counted once their sheet is done
+            if on_batch is not None:
+                on_batch(summary['rows'])
+            if on_sheet is not None:
+                on_sheet()
+    return summaries
+
+
+def ingest(optimization_data, progress=None):
+    """Parse every sheet of the upload once into content-addressed columnar sidecars.
+
+    CSV and Parquet uploads are a single table and skip openpyxl entirely.
+    progress(sheets_total=, sheets_done=, rows_parsed=) is called as parsing advances.
+    """
+    source = optimization_data.file.path
+    content_hash = file_sha256(source)
+    source_format = file_format(source)
+    if source_format is None:
+        raise ValueError(f'Unsupported file format: {os.path.basename(source)}')
+    if source_format == 'xlsx':
+        names = sheet_names(source)
+    else:
+        names = [os.path.basename(source)]
+    targets = [columnar_path(content_hash, index) for index in range(len(names))]
+
+    # Same bytes may have been parsed before; only parse the sheets that are missing
+    pending = [(index, target) for index, target in enumerate(targets) if not os.path.exists(target)]
+    parsed = {'sheets_total': len(names), 'sheets_done': len(names) - len(pending), 'rows_parsed': 0}
+
+    def on_batch(rows):
+        parsed['rows_parsed'] += rows
+        if progress is not None:
+            progress(**parsed)
+
+    def on_sheet():
+        parsed['sheets_done'] += 1
+        if progress is not None:
+            progress(**parsed)
+
+    if progress is not None:
+        progress(**parsed)
+    if source_format == 'xlsx':
+        summaries = parse_sheets(source, pending, on_batch, on_sheet)
+    else:
+        summaries = {}
+        for index, target in pending:
+            summaries[index] = stream_native_to_arrow(source, target, source_format, on_batch)
+            on_sheet()
+    for target in targets:
+        os.utime(target)  # Mark reused sidecars as fresh
+
+    summary = summaries.get(0)
+    if summary is None:
+        summary = optimization_data.summary if optimization_data.content_hash == content_hash else None
+    if not summary:
+        # Reuse the summary of an earlier upload of the same bytes
+        summary = (
+            type(optimization_data).objects
+            .filter(content_hash=content_hash)
+            .exclude(summary={})
+            .values_list('summary', flat=True)
+            .first()
+        )
+    if not summary:
+        table = feather.read_table(targets[0], memory_map=True)
+        summary = summarize_batches(table.schema, table.to_batches(max_chunksize=settings.INGEST_CHUNK_ROWS))
+
+    optimization_data.content_hash = content_hash
+    optimization_data.columnar_file = os.path.relpath(targets[0], settings.MEDIA_ROOT)
+    optimization_data.summary = summary
+    optimization_data.sheets = [
+        {
+            'index': index,
+            'name': name,
+            'file': os.path.relpath(target, settings.MEDIA_ROOT),
+            'rows': feather.read_table(target, memory_map=True).num_rows,
+        }
+        for index, (name, target) in enumerate(zip(names, targets))
+    ]
+    optimization_data.save(update_fields=['content_hash', 'columnar_file', 'summary', 'sheets'])
+    return targets[0]
+
+
+def sidecar_path(optimization_data):
+    """Return the recorded sidecar path, or None when it is missing or stale."""
+    if not optimization_data.columnar_file:
+        return None
+
+    sidecar = os.path.join(settings.MEDIA_ROOT, optimization_data.columnar_file)
+    if not os.path.exists(sidecar):
+        return None
+
+    try:
+        source_mtime = os.path.getmtime(optimization_data.file.path)
+    except (OSError, ValueError):
+        # The original upload is gone, the sidecar is all we have
+        return sidecar
+    if os.path.getmtime(sidecar) < source_mtime:
+        return None
+    return sidecar
+
+
+def load_table(optimization_data, sheet_index=0):
+    """Load one sheet of the upload as a memory-mapped Arrow table, ingesting it if needed."""
+    sidecar = sidecar_path(optimization_data) or ingest(optimization_data)
+    if sheet_index:
+        sidecar = os.path.join(settings.MEDIA_ROOT, optimization_data.sheets[sheet_index]['file'])
+    return feather.read_table(sidecar, memory_map=True)
+
+
+def read_head(optimization_data, nrows):
+    """Read only the first rows of an upload, for previews."""
+    sidecar = sidecar_path(optimization_data)
+    if sidecar:
+        return feather.read_table(sidecar, memory_map=True).slice(0, nrows).to_pandas()
+    if file_format(optimization_data.file.path) != 'xlsx':
+        return load_table(optimization_data).slice(0, nrows).to_pandas()
+    # pandas stops openpyxl's row iteration after nrows
+    return pd.read_excel(optimization_data.file.path, nrows=nrows)
+
+
+def upload_summary(optimization_data):
+    """Ingest-time summary, computed from the sidecar for uploads ingested before summaries existed."""
+    table = load_table(optimization_data)
+    if not optimization_data.summary:
+        optimization_data.summary = summarize_batches(table.schema, table.to_batches(max_chunksize=settings.INGEST_CHUNK_ROWS))
+        optimization_data.save(update_fields=['summary'])
+    return optimization_data.summary
+
@@ -0,0 +1,183 @@
+import os
+import socket
+import time
+import traceback
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from .analytics import build_database
+from .entitlements import entitlements_for
+from .ingest import ingest
+from .kpis import upload_kpis
+from .models import OptimizationResult, ProcessingJob
+from .solver import solve
+from .utils import copy_charts, process_excel_file
+from .versions import link_version
+
+# Job kind -> callable(job, timings); populated with the @handler decorator
+HANDLERS = {}
+
+
+def handler(kind):
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+
+def report(job, **fields):
+    """Merge fields into the job's progress and save it for the progress stream."""
+    job.progress = {**job.progress, **fields}
+    job.save(update_fields=['progress'])
+
+
+@contextmanager
+def stage(timings, name, job=None):
+    """Record how long a pipeline stage took, in seconds; with a job, also report it as the current stage."""
+    if job is not None:
+        report(job, stage=name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = round(time.perf_counter() - started, 4)
+
+
+def enqueue(optimization_data, kind='process', params=None):
+    """Queue background work for an upload in its owner's priority lane and return the job."""
+    return ProcessingJob.objects.create(
+        optimization_data=optimization_data,
+        kind=kind,
+        params=params or {},
+        priority=entitlements_for(optimization_data.user_id)['priority'],
+    )
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def next_job():
+    """The highest-priority, oldest queued job whose owner is below their running-job limit."""
+    running = (
+        ProcessingJob.objects.filter(status='running')
+        .values_list('optimization_data__user')
+        .annotate(Count('id'))
+    )
+    # Only users with running jobs can be at their limit, and there are at most as many of those as workers
+    at_limit = [user_id for user_id, count in running if count >= entitlements_for(user_id)['max_running_jobs']]
+    return (
+        ProcessingJob.objects.filter(status='queued')
+        .exclude(optimization_data__user__in=at_limit)
+        .select_related('optimization_data')
+        .order_by('-priority', 'created_at', 'id')
+        .first()
+    )
+
+
+def claim_next(worker_id):
+    """Atomically move the next eligible queued job to running, or return None."""
+    # The running-job count and the claim share one transaction. Under SQLite's
+    # IMMEDIATE transactions (see DATABASES) claimers take the write lock up
+    # front, so two workers can't both see a user below their limit.
+    with transaction.atomic():
+        while True:
+            job = next_job()
+            if job is None:
+                return None
+
+            # Another worker may have claimed it between the SELECT and the UPDATE
+            claimed = ProcessingJob.objects.filter(pk=job.pk, status='queued').update(
+                status='running',
+                worker=worker_id,
+                started_at=timezone.now(),
+                attempts=F('attempts') + 1,
+                progress={},
+            )
+            if claimed:
+                job.refresh_from_db()
+                return job
+
+
+def run_job(job):
+    """Run a claimed job through its handler and record the outcome."""
+    timings = {}
+    try:
+        with stage(timings, 'total'):
+            HANDLERS[job.kind](job, timings)
+    except Exception:
+        job.status = 'failed'
+        job.error = traceback.format_exc()
+    else:
+        job.status = 'done'
+        job.error = ''
+
+    job.timings = timings
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error', 'timings', 'finished_at'])
+    return job
+
+
+def requeue_stale(max_age=None):
+    """Put jobs whose worker died mid-run back on the queue."""
+    max_age = max_age or settings.JOB_STALE_AFTER
+    cutoff = timezone.now() - timedelta(seconds=max_age)
+    return ProcessingJob.objects.filter(status='running', started_at__lt=cutoff).update(status='queued', worker='')
+
+
+def work(worker_id=None, poll_interval=1.0, once=False):
+    """Worker loop: claim and run jobs until the queue is empty (once) or forever."""
+    worker_id = worker_id or worker_name()
+    while True:
+        job = claim_next(worker_id)
+        if job is None:
+            if once:
+                return
+            time.sleep(poll_interval)
+            continue
+        run_job(job)
+
+
+@handler('process')
+def process_upload(job, timings):
+    optimization_data = job.optimization_data
+    report(job, bytes_received=optimization_data.file.size)
+    with stage(timings, 'ingest', job):
+        ingest(optimization_data, progress=lambda **parsed: report(job, **parsed))
+    with stage(timings, 'lineage', job):
+        link_version(optimization_data)
+    with stage(timings, 'charts', job):
+        # Charts of an identical upload are copied instead of recomputed
+        source = optimization_data.chart_source()
+        if source is None:
+            charts = process_excel_file(optimization_data)
+        else:
+            charts = copy_charts(source, optimization_data)
+        report(job, charts_precomputed=charts)
+    with stage(timings, 'analytics', job):
+        build_database(optimization_data)
+    with stage(timings, 'kpis', job):
+        upload_kpis(optimization_data)
+
+
+@handler('optimize')
+def optimize_upload(job, timings):
+    optimization_data = job.optimization_data
+    with stage(timings, 'analytics', job):
+        build_database(optimization_data)
+    with stage(timings, 'solve', job):
+        result = solve(optimization_data, job.params)
+    OptimizationResult.objects.create(
+        optimization_data=optimization_data,
+        job=job,
+        params=result['params'],
+        status=result['status'],
+        objective=result['objective'],
+        baseline=result['baseline'],
+        solution=result,
+    )
@@ -0,0 +1,83 @@
+import math
+
+import pandas as pd
+
+from . import analytics
+
+KPI_VERSION = 1  # Bump when the formulas below change so stored KPIs are recomputed
+
+SALES_ACCOUNT = 'Sales'
+# Balance-sheet accounts; finance uploads that include them get the balance-sheet ratios too
+ACCOUNTS_RECEIVABLE = 'Accounts Receivable'
+CURRENT_ASSETS = 'Current Assets'
+CURRENT_LIABILITIES = 'Current Liabilities'
+DEBT = 'Total Debt'
+EQUITY = 'Equity'
+BALANCE_SHEET_ACCOUNTS = {ACCOUNTS_RECEIVABLE, CURRENT_ASSETS, CURRENT_LIABILITIES, DEBT, EQUITY}
+
+
+def ratio(numerator, denominator, scale=1):
+    return (numerator / denominator.where(denominator != 0)) * scale
+
+
+def kpi_frame(rollup):
+    """Every KPI for every year at once from (Account, Year, amount, abs_amount) rows.
+
+    Income-statement accounts other than Sales count as cost; the data
+    stores them as negative amounts, so cost uses their absolute values.
+    """
+    amounts = rollup.pivot_table(index='Year', columns='Account', values='amount', aggfunc='sum').sort_index()
+    absolute = rollup.pivot_table(index='Year', columns='Account', values='abs_amount', aggfunc='sum').sort_index()
+    missing = pd.Series(float('nan'), index=amounts.index)
+
+    def account(name):
+        return amounts[name] if name in amounts else missing
+
+    cost_accounts = [name for name in absolute.columns if name != SALES_ACCOUNT and name not in BALANCE_SHEET_ACCOUNTS]
+    sales = account(SALES_ACCOUNT)
+    cost = absolute[cost_accounts].sum(axis=1)
+    operating_income = sales - cost
+    return pd.DataFrame({
+        'accounts_receivable': account(ACCOUNTS_RECEIVABLE),
+        'sales': sales,
+        'operating_income': operating_income,
+        'cost': cost,
+        'current_ratio': ratio(account(CURRENT_ASSETS), account(CURRENT_LIABILITIES)),
+        'profit_margin': ratio(operating_income, sales, 100),
+        'operating_ratio': ratio(cost, sales, 100),
+        'debt_to_equity': ratio(account(DEBT), account(EQUITY)),
+    })
+
+
+def json_number(value):
+    return None if value is None or math.isnan(value) else round(float(value), 4)
+
+
+def compute_kpis(optimization_data, scenario='Actuals'):
+    """KPIs for the latest year of `scenario`, plus each KPI's yearly trend for sparklines."""
+    rollup = analytics.query(optimization_data, """
+        SELECT Account, Year, amount, abs_amount
+        FROM rollup_account_year
+        WHERE Scenario = ?
+        """, [scenario])
+    if rollup.empty:
+        return {'version': KPI_VERSION, 'scenario': scenario, 'year': None, 'values': {}, 'trend': {}}
+
+    frame = kpi_frame(rollup)
+    return {
+        'version': KPI_VERSION,
+        'scenario': scenario,
+        'year': str(frame.index[-1]),
+        'values': {name: json_number(value) for name, value in frame.iloc[-1].items()},
+        'trend': {name: [json_number(value) for value in column] for name, column in frame.items()},
+    }
+
+
+def upload_kpis(optimization_data):
+    """Stored KPIs for this upload version, computed on first use for older uploads."""
+    kpis = optimization_data.kpis
+    if kpis.get('version') != KPI_VERSION:
+        kpis = compute_kpis(optimization_data) if analytics.has_cube(optimization_data) else {'version': KPI_VERSION, 'values': {}, 'trend': {}}
+        optimization_data.kpis = kpis
+        optimization_data.save(update_fields=['kpis'])
+    return kpis
@@ -0,0 +1,53 @@
+import multiprocessing
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from optimization.jobs import requeue_stale, work
+
+
+def _worker_main(poll_interval, once):
+    # Spawned workers (non-fork platforms) start with an unconfigured Django
+    django.setup()
+    work(poll_interval=poll_interval, once=once)
+
+
+class Command(BaseCommand):
+    help = 'Run the upload processing job queue with a pool of worker processes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.JOB_WORKERS,
+                            help='Number of worker processes.')
+        parser.add_argument('--poll-interval', type=float, default=settings.JOB_POLL_INTERVAL,
+                            help='Seconds to wait before polling an empty queue again.')
+        parser.add_argument('--once', action='store_true',
+                            help='Drain the queue and exit instead of waiting for new jobs.')
+
+    def handle(self, *args, **options):
+        requeued = requeue_stale()
+        if requeued:
+            self.stdout.write(f'Requeued {requeued} stale job(s).')
+
+        workers = max(1, options['workers'])
+        if workers == 1:
+            work(poll_interval=options['poll_interval'], once=options['once'])
+            return
+
+        # Forked children must not share the parent's SQLite connection
+        connections.close_all()
+        processes = [
+            multiprocessing.Process(target=_worker_main, args=(options['poll_interval'], options['once']))
+            for _ in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        self.stdout.write(f'Started {workers} job workers.')
+
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from optimization.streamlit_pool import Supervisor
+
+
+class Command(BaseCommand):
+    help = 'Start and supervise the pool of Streamlit dashboard workers.'
+
+    def handle(self, *args, **options):
+        try:
+            Supervisor(stdout=self.stdout).run()
+        except KeyboardInterrupt:
+            self.stdout.write('Streamlit pool stopped.')
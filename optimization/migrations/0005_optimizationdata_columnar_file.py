@@ -0,0 +1,23 @@
+# Generated by Django 5.1.1 on 2026-10-18 08:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('optimization', '0004_visualizationdata'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='optimizationdata',
+            name='columnar_file',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='optimizationdata',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-18 08:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('optimization', '0006_processingjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='visualizationdata',
+            name='resolution',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
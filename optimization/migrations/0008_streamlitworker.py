@@ -0,0 +1,26 @@
+# Generated by Django 5.1.1 on 2026-10-18 08:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('optimization', '0007_visualizationdata_resolution'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StreamlitWorker',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('port', models.PositiveIntegerField(unique=True)),
+                ('pid', models.PositiveIntegerField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('stopped', 'Stopped'), ('requested', 'Start Requested'), ('starting', 'Starting'), ('healthy', 'Healthy'), ('unhealthy', 'Unhealthy')], default='stopped', max_length=10)),
+                ('restarts', models.PositiveIntegerField(default=0)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('last_health_check', models.DateTimeField(blank=True, null=True)),
+                ('last_routed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-18 08:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('optimization', '0008_streamlitworker'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='visualizationdata',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-18 08:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('optimization', '0011_optimizationdata_sheets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='optimizationdata',
+            name='original_name',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.1 on 2026-10-18 08:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('optimization', '0013_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='optimizationdata',
+            name='changes',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='optimizationdata',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='revisions', to='optimization.optimizationdata'),
+        ),
+        migrations.AddField(
+            model_name='optimizationdata',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
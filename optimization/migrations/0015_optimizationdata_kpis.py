@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-18 08:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('optimization', '0014_optimizationdata_lineage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='optimizationdata',
+            name='kpis',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.1 on 2026-10-18 08:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('optimization', '0015_optimizationdata_kpis'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='processingjob',
+            name='params',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.CreateModel(
+            name='OptimizationResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('params', models.JSONField(default=dict)),
+                ('status', models.CharField(max_length=20)),
+                ('objective', models.FloatField(blank=True, null=True)),
+                ('baseline', models.FloatField(blank=True, null=True)),
+                ('solution', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('job', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='result', to='optimization.processingjob')),
+                ('optimization_data', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='results', to='optimization.optimizationdata')),
+            ],
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.1 on 2026-10-18 09:00
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('optimization', '0016_optimizationresult'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='optimizationdata',
+            index=models.Index(fields=['user', 'upload_date'], name='optimizatio_user_id_0bdf28_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='processingjob',
+            index=models.Index(fields=['status', 'created_at'], name='optimizatio_status_7bb2e8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['user', 'expiration_date'], name='optimizatio_user_id_635441_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='visualizationdata',
+            index=models.Index(fields=['optimization_data', 'chart_type', 'resolution'], name='optimizatio_optimiz_6a7ad0_idx'),
+        ),
+    ]
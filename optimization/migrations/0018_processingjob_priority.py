@@ -0,0 +1,26 @@
+# Generated by Django 5.1.1 on 2026-10-18 09:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('optimization', '0017_hot_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='processingjob',
+            name='optimizatio_status_7bb2e8_idx',
+        ),
+        migrations.AddField(
+            model_name='processingjob',
+            name='priority',
+            field=models.SmallIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='processingjob',
+            index=models.Index(fields=['status', '-priority', 'created_at'], name='optimizatio_status_645fd2_idx'),
+        ),
+    ]
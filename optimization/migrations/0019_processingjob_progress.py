@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-18 09:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('optimization', '0018_processingjob_priority'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='processingjob',
+            name='progress',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.1 on 2026-10-18 09:19
+
+from django.db import migrations
+
+
+def copy_shared_charts(apps, schema_editor):
+    """Uploads that read an identical upload's charts get their own copy of the rows."""
+    OptimizationData = apps.get_model('optimization', 'OptimizationData')
+    VisualizationData = apps.get_model('optimization', 'VisualizationData')
+    for optimization_data in OptimizationData.objects.exclude(content_hash='').filter(visualization__isnull=True):
+        source = (
+            OptimizationData.objects
+            .filter(content_hash=optimization_data.content_hash, visualization__isnull=False)
+            .order_by('id')
+            .first()
+        )
+        if source is None:
+            continue
+        VisualizationData.objects.bulk_create([
+            VisualizationData(optimization_data=optimization_data, chart_type=chart_type, resolution=resolution, data=data)
+            for chart_type, resolution, data in
+            VisualizationData.objects.filter(optimization_data=source).values_list('chart_type', 'resolution', 'data')
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('optimization', '0019_processingjob_progress'),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_shared_charts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-18 09:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('optimization', '0020_copy_shared_charts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadsession',
+            name='digest_state',
+            field=models.BinaryField(blank=True, default=b''),
+        ),
+    ]
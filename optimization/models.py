@@ -1,6 +1,10 @@
+import os
+import uuid
+
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
+from .encoding import decode_payload
 
 class Subscription(models.Model):
     PAYMENT_METHOD_CHOICES = [
@@ -35,20 +39,199 @@ class Subscription(models.Model):
     class Meta:
         verbose_name = 'Subscription'
         verbose_name_plural = 'Subscriptions'
+        indexes = [
+            models.Index(fields=['user', 'expiration_date']),
+        ]
 
 
 class OptimizationData(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
-    file = models.FileField(upload_to='uploads/')
+    file = models.FileField(upload_to='uploads/')  # Stored content-addressed, see uploads.store_upload
+    original_name = models.CharField(max_length=255, blank=True)
     upload_date = models.DateTimeField(auto_now_add=True)
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    columnar_file = models.CharField(max_length=255, blank=True)  # Arrow sidecar, relative to MEDIA_ROOT
+    summary = models.JSONField(default=dict, blank=True)  # Row count, describe() stats and value counts from ingest
+    sheets = models.JSONField(default=list, blank=True)  # [{index, name, file, rows}] for every sheet in the workbook
+    parent = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='revisions')  # Upload this one supersedes
+    version = models.PositiveIntegerField(default=1)
+    changes = models.JSONField(default=dict, blank=True)  # Partition-level diff against the parent, see versions.diff_tables
+    kpis = models.JSONField(default=dict, blank=True)  # Financial KPIs for this version, see kpis.compute_kpis
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'upload_date']),  # A user's uploads, newest first
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.upload_date.strftime('%Y-%m-%d')}"
 
+    @property
+    def display_name(self):
+        return self.original_name or os.path.basename(self.file.name)
+
+    def chart_source(self):
+        """An earlier upload of the same bytes that already has charts, or None."""
+        if not self.content_hash:
+            return None
+        return (
+            OptimizationData.objects
+            .filter(content_hash=self.content_hash, visualization__isnull=False)
+            .exclude(pk=self.pk)
+            .order_by('id')
+            .first()
+        )
+
 class VisualizationData(models.Model):
     optimization_data = models.ForeignKey(OptimizationData, on_delete=models.CASCADE, related_name='visualization')
     chart_type = models.CharField(max_length=20)
+    resolution = models.PositiveIntegerField(null=True, blank=True)  # Point budget of a downsampled level; null is full resolution
     data = models.JSONField()  # Store the processed data as JSON
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def payload(self):
+        """Chart data with compact-encoded series decoded back to lists."""
+        return decode_payload(self.data)
+
+    class Meta:
+        indexes = [
+            # achart_for_width: one upload's chart type, ordered by resolution
+            models.Index(fields=['optimization_data', 'chart_type', 'resolution']),
+        ]
 
     def __str__(self):
         return f"{self.optimization_data.user.username} - {self.chart_type}"
+
+
+class UploadSession(models.Model):
+    """A chunked, resumable upload; chunks are appended in order until `received` reaches `size`."""
+    STATUS_CHOICES = [
+        ('open', 'Open'),
+        ('complete', 'Complete'),
+        ('failed', 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    received = models.PositiveBigIntegerField(default=0)
+    file_format = models.CharField(max_length=10, blank=True)  # Sniffed from the first chunk
+    # Running SHA-256 of the received bytes (see digests.ResumableSHA256); empty when it must be recomputed
+    digest_state = models.BinaryField(blank=True, default=b'')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='open')
+    error = models.TextField(blank=True)
+    optimization_data = models.ForeignKey(OptimizationData, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def to_dict(self):
+        return {
+            'id': str(self.id),
+            'filename': self.filename,
+            'size': self.size,
+            'received': self.received,
+            'status': self.status,
+            'error': self.error,
+            'upload_id': self.optimization_data_id,
+        }
+
+    def __str__(self):
+        return f"{self.filename} - {self.received}/{self.size}"
+
+
+class ProcessingJob(models.Model):
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    optimization_data = models.ForeignKey(OptimizationData, on_delete=models.CASCADE, related_name='jobs')
+    kind = models.CharField(max_length=20, default='process')
+    params = models.JSONField(default=dict, blank=True)  # Handler-specific arguments, e.g. solver parameters
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued', db_index=True)
+    priority = models.SmallIntegerField(default=0)  # Lane from the owner's subscription tier; higher is claimed first
+    attempts = models.PositiveSmallIntegerField(default=0)
+    worker = models.CharField(max_length=64, blank=True)
+    error = models.TextField(blank=True)
+    timings = models.JSONField(default=dict, blank=True)  # Seconds spent per pipeline stage
+    progress = models.JSONField(default=dict, blank=True)  # Current stage and its counters, for the progress stream
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', '-priority', 'created_at']),  # claim_next: highest-priority, oldest queued job
+        ]
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'upload_id': self.optimization_data_id,
+            'kind': self.kind,
+            'params': self.params,
+            'status': self.status,
+            'priority': self.priority,
+            'attempts': self.attempts,
+            'error': self.error,
+            'timings': self.timings,
+            'progress': self.progress,
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+    def __str__(self):
+        return f"{self.kind} #{self.id} - {self.status}"
+
+
+class OptimizationResult(models.Model):
+    """Product-mix / price-point plan produced by an 'optimize' job, see solver.solve."""
+    optimization_data = models.ForeignKey(OptimizationData, on_delete=models.CASCADE, related_name='results')
+    job = models.OneToOneField(ProcessingJob, on_delete=models.SET_NULL, null=True, blank=True, related_name='result')
+    params = models.JSONField(default=dict)  # Parameters after defaults were applied
+    status = models.CharField(max_length=20)  # optimal or infeasible
+    objective = models.FloatField(null=True, blank=True)  # Operating income of the plan
+    baseline = models.FloatField(null=True, blank=True)  # Operating income today
+    solution = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'upload_id': self.optimization_data_id,
+            'job_id': self.job_id,
+            'params': self.params,
+            'status': self.status,
+            'objective': self.objective,
+            'baseline': self.baseline,
+            'solution': self.solution,
+            'created_at': self.created_at.isoformat(),
+        }
+
+    def __str__(self):
+        return f"Result #{self.id} - {self.status}"
+
+
+class StreamlitWorker(models.Model):
+    STATUS_CHOICES = [
+        ('stopped', 'Stopped'),
+        ('requested', 'Start Requested'),
+        ('starting', 'Starting'),
+        ('healthy', 'Healthy'),
+        ('unhealthy', 'Unhealthy'),
+    ]
+
+    port = models.PositiveIntegerField(unique=True)
+    pid = models.PositiveIntegerField(null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='stopped')
+    restarts = models.PositiveIntegerField(default=0)
+    started_at = models.DateTimeField(null=True, blank=True)
+    last_health_check = models.DateTimeField(null=True, blank=True)
+    last_routed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Streamlit :{self.port} - {self.status}"
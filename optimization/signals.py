@@ -0,0 +1,18 @@
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .dashboard import dashboard_cache_key
+from .entitlements import entitlement_cache_key
+from .models import OptimizationData, Subscription
+
+
+@receiver([post_save, post_delete], sender=Subscription)
+@receiver([post_save, post_delete], sender=OptimizationData)
+def invalidate_dashboard_context(sender, instance, **kwargs):
+    cache.delete(dashboard_cache_key(instance.user_id))
+
+
+@receiver([post_save, post_delete], sender=Subscription)
+def invalidate_entitlements(sender, instance, **kwargs):
+    cache.delete(entitlement_cache_key(instance.user_id))
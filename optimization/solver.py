@@ -0,0 +1,167 @@
+import numpy as np
+from scipy import sparse
+from scipy.optimize import Bounds, LinearConstraint, linprog, milp
+
+from . import analytics
+from .kpis import BALANCE_SHEET_ACCOUNTS, SALES_ACCOUNT
+
+# Parameters of the product-mix / price-point model, overridable per job
+DEFAULT_PARAMS = {
+    'scenario': 'Actuals',
+    'year': None,  # Latest year of the scenario
+    'price_points': [0.9, 1.0, 1.1],  # Price multipliers each business unit may choose from
+    'elasticity': -1.5,  # % change in demand per % change in price
+    'capacity': 1.5,  # Max volume per business unit, as a multiple of its current volume
+    'min_volume': 0.0,  # Min volume per business unit, as a multiple of its current volume
+    'budget': None,  # Max total cost; defaults to the current total cost
+}
+
+
+def clean_params(params):
+    """Merge job parameters over the defaults, raising ValueError on bad values."""
+    unknown = set(params) - set(DEFAULT_PARAMS)
+    if unknown:
+        raise ValueError(f"Unknown parameters: {', '.join(sorted(unknown))}")
+
+    cleaned = {**DEFAULT_PARAMS, **params}
+    try:
+        cleaned['scenario'] = str(cleaned['scenario'])
+        cleaned['year'] = None if cleaned['year'] is None else str(cleaned['year'])
+        cleaned['price_points'] = sorted({float(point) for point in cleaned['price_points']})
+        for name in ('elasticity', 'capacity', 'min_volume'):
+            cleaned[name] = float(cleaned[name])
+        cleaned['budget'] = None if cleaned['budget'] is None else float(cleaned['budget'])
+    except (TypeError, ValueError):
+        raise ValueError('Parameters must be numbers, except scenario and year')
+
+    if not cleaned['price_points'] or min(cleaned['price_points']) <= 0:
+        raise ValueError('price_points must be positive multipliers')
+    if not 0 <= cleaned['min_volume'] <= cleaned['capacity']:
+        raise ValueError('min_volume must be between 0 and capacity')
+    return cleaned
+
+
+def unit_economics(optimization_data, scenario, year=None):
+    """Revenue and cost per business unit for one scenario year, from the analytics rollups."""
+    if year is None:
+        latest = analytics.query(optimization_data, "SELECT MAX(Year) AS year FROM rollup_unit WHERE Scenario = ?", [scenario])
+        year = latest['year'].iloc[0]
+    placeholders = ', '.join('?' * len(BALANCE_SHEET_ACCOUNTS))
+    economics = analytics.query(optimization_data, f"""
+        SELECT business_unit,
+               SUM(amount) FILTER (WHERE Account = ?) AS revenue,
+               SUM(abs_amount) FILTER (WHERE Account != ? AND Account NOT IN ({placeholders})) AS cost
+        FROM rollup_unit
+        WHERE Scenario = ? AND Year = ?
+        GROUP BY business_unit
+        ORDER BY business_unit
+        """, [SALES_ACCOUNT, SALES_ACCOUNT, *sorted(BALANCE_SHEET_ACCOUNTS), scenario, year])
+    return economics.fillna(0.0), year
+
+
+def build_problem(revenue, cost, params):
+    """Vectorised MILP over business units (U) x price points (K).
+
+    x[u, k] is unit u's volume (relative to today) if it sells at price point k,
+    z[u, k] says whether it does. At most one price point per unit, volume is
+    capped by demand at that price and by capacity, and total cost stays
+    within budget. Maximises operating income.
+    """
+    prices = np.asarray(params['price_points'])
+    units, points = len(revenue), len(prices)
+    n = units * points
+
+    # Linear demand response: volume available at each price, per unit
+    demand = np.clip(1 + params['elasticity'] * (prices - 1), 0, None)
+    cap = np.minimum(demand, params['capacity'])
+    cap = np.broadcast_to(cap, (units, points)).ravel()
+
+    unit_cost = np.repeat(cost, points)
+    margin = (np.outer(revenue, prices) - cost[:, None]).ravel()
+    c = np.concatenate([-margin, np.zeros(n)])  # milp minimises
+
+    eye = sparse.identity(n, format='csr')
+    rows = sparse.kron(sparse.identity(units), np.ones((1, points)), format='csr')  # Sums over each unit's price points
+    zeros_u = sparse.csr_matrix((units, n))
+
+    constraints = [
+        # x - cap * z <= 0: volume only at the chosen price, up to demand/capacity
+        LinearConstraint(sparse.hstack([eye, -sparse.diags(cap)]), -np.inf, 0),
+        # x - min_volume * z >= 0
+        LinearConstraint(sparse.hstack([eye, -params['min_volume'] * eye]), 0, np.inf),
+        # One price point per unit, or none if the unit is dropped
+        LinearConstraint(sparse.hstack([zeros_u, rows]), 0, 1),
+        # Budget on total cost
+        LinearConstraint(sparse.csr_matrix(np.concatenate([unit_cost, np.zeros(n)])), -np.inf, params['budget']),
+    ]
+    bounds = Bounds(np.zeros(2 * n), np.concatenate([cap, np.ones(n)]))
+    integrality = np.concatenate([np.zeros(n), np.ones(n)])
+    return c, constraints, bounds, integrality
+
+
+def solve(optimization_data, params):
+    """Optimise product mix and price points for an upload. Returns a JSON-safe result."""
+    params = clean_params(params)
+    economics, year = unit_economics(optimization_data, params['scenario'], params['year'])
+    return solve_economics(
+        economics['business_unit'].tolist(),
+        economics['revenue'].to_numpy(dtype=float),
+        economics['cost'].to_numpy(dtype=float),
+        year,
+        params,
+    )
+
+
+def solve_economics(units, revenue, cost, year, params):
+    """Solve for given per-unit revenue and cost arrays; params must already be cleaned."""
+    params = dict(params)
+    baseline = float((revenue - cost).sum())
+    if params['budget'] is None:
+        params['budget'] = float(cost.sum())
+
+    result = {'params': params, 'year': None if year is None else str(year), 'baseline': baseline}
+    if not len(revenue):
+        return {**result, 'status': 'infeasible', 'message': 'No data for this scenario and year', 'objective': None, 'plan': []}
+
+    prices = np.asarray(params['price_points'])
+    count, points = len(revenue), len(prices)
+    if points == 1:
+        # A single price point leaves a continuous product-mix LP
+        cap = min(max(0.0, 1 + params['elasticity'] * (prices[0] - 1)), params['capacity'])
+        solution = linprog(
+            -(revenue * prices[0] - cost),
+            A_ub=sparse.csr_matrix(cost[None, :]), b_ub=[params['budget']],
+            bounds=list(zip(np.full(count, min(params['min_volume'], cap)), np.full(count, cap))),
+            method='highs',
+        )
+        volume = solution.x.reshape(count, 1) if solution.success else None
+    else:
+        c, constraints, bounds, integrality = build_problem(revenue, cost, params)
+        solution = milp(c, constraints=constraints, bounds=bounds, integrality=integrality)
+        volume = solution.x[:count * points].reshape(count, points) if solution.success else None
+
+    if volume is None:
+        return {**result, 'status': 'infeasible', 'message': solution.message, 'objective': None, 'plan': []}
+
+    chosen = volume.argmax(axis=1)
+    volume = volume[np.arange(count), chosen]
+    price = prices[chosen]
+    plan_revenue = revenue * price * volume
+    plan_cost = cost * volume
+    return {
+        **result,
+        'status': 'optimal',
+        'message': solution.message,
+        'objective': float((plan_revenue - plan_cost).sum()),
+        'plan': [
+            {
+                'business_unit': unit,
+                'price': float(p) if v > 0 else None,  # Dropped units have no price
+                'volume': round(float(v), 6),
+                'revenue': float(r),
+                'cost': float(k),
+                'profit': float(r - k),
+            }
+            for unit, p, v, r, k in zip(units, price, volume, plan_revenue, plan_cost)
+        ],
+    }
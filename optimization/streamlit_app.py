@@ -1,11 +1,9 @@
 import os
 import sys
-import random
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 import streamlit as st
-import duckdb
 import django
 
 # Add the project directory to the Python path
@@ -16,7 +14,15 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "product_optimization.settings")
 django.setup()
 
 # Import your Django model after setting up Django
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db.models import Count, Max
 from optimization.models import OptimizationData  # Adjust as necessary
+from optimization import analytics
+from optimization.frame_cache import FrameCache, frame_key
+from optimization.ingest import read_head
+from optimization.kpis import upload_kpis
+from optimization.utils import user_id_from_token
 
 #######################################
 # PAGE SETUP
@@ -26,45 +32,75 @@ st.set_page_config(page_title="Sales Dashboard", page_icon=":bar_chart:", layout
 st.title("Sales Streamlit Dashboard")
 st.markdown("_Prototype v0.4.1_")
 
-# Load data from the OptimizationData model
-@st.cache_data
-def load_data():
-    optimization_data = OptimizationData.objects.all()  # Fetch all instances from the database
-    return optimization_data
-
-# Function to read the uploaded Excel file
-def read_uploaded_file(file_path):
+PREVIEW_PAGE_SIZE = 10  # Uploads listed per preview page
+PREVIEW_ROWS = 100  # Rows read for each file preview
+
+# The Django view passes a signed token identifying the logged-in user
+user_id = user_id_from_token(st.query_params.get("token", ""))
+if user_id is None:
+    st.error("Open the dashboard from your account page to see your uploads.")
+    st.stop()
+
+# Cheap probe that changes whenever one of the user's uploads is added or removed
+def upload_version(user_id):
+    return tuple(OptimizationData.objects.filter(user_id=user_id).aggregate(
+        latest_id=Max("id"), latest_upload=Max("upload_date"), count=Count("id")
+    ).values())
+
+# Load one page of the user's uploads; only re-queried when the upload version changes
+@st.cache_data(max_entries=64)
+def load_data(user_id, version, page_number):
+    paginator = Paginator(OptimizationData.objects.filter(user_id=user_id).order_by("-upload_date", "-id"), PREVIEW_PAGE_SIZE)
+    page = paginator.get_page(page_number)
+    return list(page.object_list), paginator.num_pages
+
+# Parsed frames shared by every session in this process, evicted by memory size
+@st.cache_resource
+def frame_cache():
+    return FrameCache(max_bytes=settings.STREAMLIT_FRAME_CACHE_BYTES)
+
+# Function to read the first rows of an upload without parsing the whole file
+def read_uploaded_file(optimization_data, nrows=PREVIEW_ROWS):
     try:
-        df = pd.read_excel(file_path)
+        key = frame_key(optimization_data) + ("head", nrows)
+        df = frame_cache().get_or_load(key, lambda: read_head(optimization_data, nrows))
         return df
     except Exception as e:
         st.error(f"Error reading the Excel file: {e}")
         return pd.DataFrame()  # Return an empty DataFrame in case of error
 
-# Get the uploaded files from the model
-optimization_data_list = load_data()
-
-# Initialize an empty DataFrame
-df = pd.DataFrame()
+version = upload_version(user_id)
 
-# Display a preview of the uploaded files and their contents
+# Display a paginated preview of the user's uploads; each file loads only when opened
 with st.expander("Uploaded Files Preview"):
+    page_number = st.number_input("Page", min_value=1, value=1, step=1)
+    optimization_data_list, num_pages = load_data(user_id, version, page_number)
+    st.caption(f"Page {min(page_number, num_pages)} of {num_pages}")
+
     for optimization_data in optimization_data_list:
-        st.subheader(optimization_data.file.name)
-        df = read_uploaded_file(optimization_data.file.path)  # Read each uploaded file
-        st.dataframe(df)  # Show the DataFrame in Streamlit
+        st.subheader(optimization_data.display_name)
+        if st.toggle(f"Show first {PREVIEW_ROWS} rows", key=f"preview-{optimization_data.id}"):
+            df = read_uploaded_file(optimization_data)
+            st.dataframe(df)  # Show the DataFrame in Streamlit
+
+            # Log the columns of the DataFrame for debugging
+            st.write("Columns in the DataFrame:", df.columns.tolist())
 
-        # Log the columns of the DataFrame for debugging
-        st.write("Columns in the DataFrame:", df.columns.tolist())
+# The charts below query the user's most recent upload
+selected_upload = OptimizationData.objects.filter(user_id=user_id).order_by("-upload_date", "-id").first()
 
 # Define months for analysis
-all_months = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+all_months = analytics.ALL_MONTHS
 
 #######################################
 # VISUALIZATION METHODS
 #######################################
 
-def plot_metric(label, value, prefix="", suffix="", show_graph=False, color_graph=""):
+def plot_metric(label, value, prefix="", suffix="", show_graph=False, color_graph="", trend=None):
+    if value is None:
+        st.metric(label, "n/a", help="This upload has no data for this metric.")
+        return
+
     fig = go.Figure()
     fig.add_trace(
         go.Indicator(
@@ -74,10 +110,10 @@ def plot_metric(label, value, prefix="", suffix="", show_graph=False, color_grap
             title={"text": label, "font": {"size": 24}},
         )
     )
-    if show_graph:
+    if show_graph and trend:
         fig.add_trace(
             go.Scatter(
-                y=random.sample(range(0, 101), 30),
+                y=trend,
                 hoverinfo="skip",
                 fill="tozeroy",
                 fillcolor=color_graph,
@@ -91,6 +127,11 @@ def plot_metric(label, value, prefix="", suffix="", show_graph=False, color_grap
     st.plotly_chart(fig, use_container_width=True)
 
 def plot_gauge(indicator_number, indicator_color, indicator_suffix, indicator_title, max_bound):
+    if indicator_number is None:
+        st.metric(indicator_title, "n/a", help="This upload has no data for this ratio.")
+        return
+
+    max_bound = max(max_bound, indicator_number * 1.25)  # Keep real values on the dial
     fig = go.Figure(
         go.Indicator(
             value=indicator_number,
@@ -104,29 +145,9 @@ def plot_gauge(indicator_number, indicator_color, indicator_suffix, indicator_ti
     fig.update_layout(height=200, margin=dict(l=10, r=10, t=50, b=10, pad=8), plot_bgcolor="rgba(0, 0, 0, 0)")  # No background color
     st.plotly_chart(fig, use_container_width=True)
 
-def plot_top_right():
-    sales_data = duckdb.sql(
-        f"""
-        -- Query to retrieve sales data for the year 2023
-        WITH sales_data AS (
-            UNPIVOT (
-                SELECT Scenario, business_unit, {','.join(all_months)}
-                FROM df
-                WHERE Year='2023'
-                AND Account='Sales'
-            )
-            ON {','.join(all_months)}
-            INTO NAME month
-            VALUE sales
-        ),
-        aggregated_sales AS (
-            SELECT Scenario, business_unit, SUM(sales) AS sales
-            FROM sales_data
-            GROUP BY Scenario, business_unit
-        )
-        SELECT * FROM aggregated_sales
-        """
-    ).df()
+def plot_top_right(optimization_data, year="2023", account="Sales"):
+    # Prepared query against the upload's persistent DuckDB database
+    sales_data = analytics.sales_by_business_unit(optimization_data, year=year, account=account)
 
     fig = px.bar(
         sales_data,
@@ -142,17 +163,8 @@ def plot_top_right():
     fig.update_layout(plot_bgcolor="rgba(0, 0, 0, 0)")  # No background color
     st.plotly_chart(fig, use_container_width=True)
 
-def plot_bottom_left():
-    sales_data = duckdb.sql(
-        f"""
-        -- Query to retrieve monthly sales for the Software business unit in 2023
-        SELECT Scenario, {','.join(all_months)}
-        FROM df
-        WHERE Year='2023'
-        AND Account='Sales'
-        AND business_unit='Software'
-        """
-    ).df()
+def plot_bottom_left(optimization_data, year="2023", account="Sales", business_unit="Software"):
+    sales_data = analytics.monthly_by_scenario(optimization_data, year=year, account=account, business_unit=business_unit)
 
     sales_data = sales_data.melt(id_vars=["Scenario"], var_name="month", value_name="sales")
 
@@ -169,29 +181,8 @@ def plot_bottom_left():
     fig.update_layout(plot_bgcolor="rgba(0, 0, 0, 0)")  # No background color
     st.plotly_chart(fig, use_container_width=True)
 
-def plot_bottom_right():
-    sales_data = duckdb.sql(
-        f"""
-        -- Query to retrieve actual yearly sales data for accounts other than 'Sales'
-        WITH sales_data AS (
-            UNPIVOT (
-                SELECT Account, Year, {','.join([f'ABS({month}) AS {month}' for month in all_months])}
-                FROM df
-                WHERE Scenario='Actuals'
-                AND Account!='Sales'
-            )
-            ON {','.join(all_months)}
-            INTO NAME year
-            VALUE sales
-        ),
-        aggregated_sales AS (
-            SELECT Account, Year, SUM(sales) AS sales
-            FROM sales_data
-            GROUP BY Account, Year
-        )
-        SELECT * FROM aggregated_sales
-        """
-    ).df()
+def plot_bottom_right(optimization_data, scenario="Actuals", exclude_account="Sales"):
+    sales_data = analytics.yearly_by_account(optimization_data, scenario=scenario, exclude_account=exclude_account)
 
     fig = px.bar(
         sales_data,
@@ -203,16 +194,9 @@ def plot_bottom_right():
     fig.update_layout(plot_bgcolor="rgba(0, 0, 0, 0)")  # No background color
     st.plotly_chart(fig, use_container_width=True)
 
-def plot_monthly_sales_distribution():
+def plot_monthly_sales_distribution(optimization_data, year="2023", account="Sales"):
     # Query for monthly sales data
-    sales_data = duckdb.sql(
-        f"""
-        -- Query to retrieve the monthly sales for 2023
-        SELECT {','.join(all_months)}  -- Select each month's sales
-        FROM df
-        WHERE Account='Sales' AND Year='2023'
-        """
-    ).df()
+    sales_data = analytics.monthly_totals(optimization_data, year=year, account=account)
 
     # Ensure the DataFrame is not empty
     if not sales_data.empty:
@@ -233,39 +217,51 @@ def plot_monthly_sales_distribution():
 # STREAMLIT LAYOUT
 #######################################
 
-# Create one row for gauges
+if selected_upload is None:
+    st.info("Upload a file to see the dashboard.")
+    st.stop()
+
+if not analytics.has_cube(selected_upload):
+    st.warning("Your latest upload has no Scenario/business_unit/Account/Year/month columns to chart.")
+    st.stop()
+
+# KPIs are computed once per upload version by the processing job
+kpis = upload_kpis(selected_upload)
+values, trend = kpis["values"], kpis["trend"]
+st.caption(f"Key figures for {kpis.get('scenario', 'Actuals')} {kpis.get('year') or ''}; sparklines show the yearly trend.")
+
 # Create one row for gauges
 gauge_col1, gauge_col2, gauge_col3, gauge_col4 = st.columns(4)
 
 with gauge_col1:
-    plot_metric("Total Accounts Receivable", 6621280, prefix="$", suffix="", show_graph=True, color_graph="rgba(0, 104, 201, 0.2)")
-    plot_gauge(1.86, "#0068C9", "%", "Current Ratio", 3)
+    plot_metric("Total Accounts Receivable", values.get("accounts_receivable"), prefix="$", suffix="", show_graph=True, color_graph="rgba(0, 104, 201, 0.2)", trend=trend.get("accounts_receivable"))
+    plot_gauge(values.get("current_ratio"), "#0068C9", "", "Current Ratio", 3)
 
 with gauge_col2:
-    plot_metric("Total Sales Amount", 1031280, prefix="$", suffix="", show_graph=True, color_graph="rgba(131, 136, 248, 0.2)")
-    plot_gauge(8.14, "#8388F8", "%", "Profit Margin", 12)
+    plot_metric("Total Sales Amount", values.get("sales"), prefix="$", suffix="", show_graph=True, color_graph="rgba(131, 136, 248, 0.2)", trend=trend.get("sales"))
+    plot_gauge(values.get("profit_margin"), "#8388F8", "%", "Profit Margin", 12)
 
 with gauge_col3:
-    plot_metric("Total Operating Income", 51280, prefix="$", suffix="", show_graph=True, color_graph="rgba(255, 186, 90, 0.2)")
-    plot_gauge(1.96, "#FFBA5A", "%", "Operating Ratio", 5)
+    plot_metric("Total Operating Income", values.get("operating_income"), prefix="$", suffix="", show_graph=True, color_graph="rgba(255, 186, 90, 0.2)", trend=trend.get("operating_income"))
+    plot_gauge(values.get("operating_ratio"), "#FFBA5A", "%", "Operating Ratio", 5)
 
 with gauge_col4:
-    plot_metric("Total Cost", 731280, prefix="$", suffix="", show_graph=True, color_graph="rgba(255, 90, 95, 0.2)")
-    plot_gauge(0.58, "#FF5A5F", "%", "Debt/Equity Ratio", 1)
+    plot_metric("Total Cost", values.get("cost"), prefix="$", suffix="", show_graph=True, color_graph="rgba(255, 90, 95, 0.2)", trend=trend.get("cost"))
+    plot_gauge(values.get("debt_to_equity"), "#FF5A5F", "", "Debt/Equity Ratio", 1)
 
 # Row for detailed sales analysis
 top_left, top_right = st.columns(2)
 
 with top_left:
-    plot_monthly_sales_distribution()  # Updated function for monthly sales
+    plot_monthly_sales_distribution(selected_upload)  # Updated function for monthly sales
 
 with top_right:
-    plot_top_right()
+    plot_top_right(selected_upload)
 
 bottom_left, bottom_right = st.columns(2)
 
 with bottom_left:
-    plot_bottom_left()
+    plot_bottom_left(selected_upload)
 
 with bottom_right:
-    plot_bottom_right()
+    plot_bottom_right(selected_upload)
@@ -0,0 +1,159 @@
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import StreamlitWorker
+
+STREAMLIT_APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'streamlit_app.py')
+SESSION_KEY = 'streamlit_port'
+
+
+def worker_ports():
+    return range(settings.STREAMLIT_BASE_PORT, settings.STREAMLIT_BASE_PORT + settings.STREAMLIT_POOL_SIZE)
+
+
+def worker_url(worker):
+    return f'http://{settings.STREAMLIT_HOST}:{worker.port}/'
+
+
+def route(request):
+    """Pick the Streamlit worker for this session, or None while none is ready.
+
+    Sessions stick to the worker they were first sent to so Streamlit's
+    per-process caches stay warm for that user; otherwise the least recently
+    used healthy worker is chosen. If nothing is healthy a stopped worker is
+    flagged for the supervisor to start.
+    """
+    healthy = StreamlitWorker.objects.filter(status='healthy')
+    worker = healthy.filter(port=request.session.get(SESSION_KEY)).first()
+    if worker is None:
+        worker = healthy.order_by('last_routed_at').first()
+
+    if worker is None:
+        StreamlitWorker.objects.filter(
+            pk__in=StreamlitWorker.objects.filter(status='stopped').values('pk')[:1]
+        ).update(status='requested')
+        return None
+
+    request.session[SESSION_KEY] = worker.port
+    StreamlitWorker.objects.filter(pk=worker.pk).update(last_routed_at=timezone.now())
+    return worker
+
+
+def is_healthy(port, timeout=2):
+    try:
+        with urllib.request.urlopen(f'http://{settings.STREAMLIT_HOST}:{port}/_stcore/health', timeout=timeout) as response:
+            return response.status == 200
+    except (urllib.error.URLError, OSError):
+        return False
+
+
+class Supervisor:
+    """Keeps a fixed pool of `streamlit run` processes alive.
+
+    Runs in its own process (python manage.py run_streamlit_pool) and uses
+    StreamlitWorker rows to share worker state with the Django views.
+    """
+
+    def __init__(self, stdout=None):
+        self.processes = {}  # port -> Popen
+        self.stdout = stdout or sys.stdout
+
+    def log(self, message):
+        self.stdout.write(f'{message}\n')
+
+    def start(self, worker):
+        command = [
+            sys.executable, '-m', 'streamlit', 'run', STREAMLIT_APP,
+            '--server.port', str(worker.port),
+            '--server.address', settings.STREAMLIT_HOST,
+            '--server.headless', 'true',
+        ]
+        process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.processes[worker.port] = process
+        worker.pid = process.pid
+        worker.status = 'starting'
+        worker.started_at = timezone.now()
+        worker.save(update_fields=['pid', 'status', 'started_at'])
+        self.log(f'Started Streamlit worker on port {worker.port} (pid {process.pid})')
+
+    def stop(self, worker, status='stopped'):
+        process = self.processes.pop(worker.port, None)
+        if process is not None and process.poll() is None:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        worker.pid = None
+        worker.status = status
+        worker.save(update_fields=['pid', 'status'])
+
+    def setup(self):
+        """Create the pool's rows and start the always-warm workers."""
+        StreamlitWorker.objects.exclude(port__in=worker_ports()).delete()
+        for index, port in enumerate(worker_ports()):
+            worker, _ = StreamlitWorker.objects.get_or_create(port=port)
+            worker.pid = None
+            worker.status = 'requested' if index < settings.STREAMLIT_POOL_MIN else 'stopped'
+            worker.save(update_fields=['pid', 'status'])
+
+    def check(self):
+        """One supervision pass: start requested workers, restart crashed ones, stop idle ones."""
+        now = timezone.now()
+        idle_cutoff = now - timedelta(seconds=settings.STREAMLIT_IDLE_TIMEOUT)
+        running = sum(1 for process in self.processes.values() if process.poll() is None)
+
+        for worker in StreamlitWorker.objects.order_by('port'):
+            process = self.processes.get(worker.port)
+
+            if worker.status == 'requested':
+                self.start(worker)
+                running += 1
+                continue
+            if worker.status == 'stopped':
+                continue
+
+            if process is None or process.poll() is not None:
+                self.log(f'Streamlit worker on port {worker.port} exited; restarting')
+                worker.restarts += 1
+                worker.save(update_fields=['restarts'])
+                self.start(worker)
+                continue
+
+            healthy = is_healthy(worker.port)
+            worker.last_health_check = now
+            if healthy:
+                worker.status = 'healthy'
+            elif worker.status != 'starting' or worker.started_at < now - timedelta(seconds=settings.STREAMLIT_START_TIMEOUT):
+                worker.status = 'unhealthy'
+            worker.save(update_fields=['status', 'last_health_check'])
+
+            if worker.status == 'unhealthy':
+                self.log(f'Streamlit worker on port {worker.port} failed its health check; restarting')
+                self.stop(worker)
+                worker.restarts += 1
+                worker.save(update_fields=['restarts'])
+                self.start(worker)
+            elif (healthy and running > settings.STREAMLIT_POOL_MIN
+                    and (worker.last_routed_at or worker.started_at) < idle_cutoff):
+                self.log(f'Stopping idle Streamlit worker on port {worker.port}')
+                self.stop(worker)
+                running -= 1
+
+    def run(self):
+        self.setup()
+        try:
+            while True:
+                self.check()
+                time.sleep(settings.STREAMLIT_HEALTH_INTERVAL)
+        finally:
+            for worker in StreamlitWorker.objects.all():
+                self.stop(worker)
@@ -0,0 +1,145 @@
+import itertools
+import threading
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.feather as feather
+from django.conf import settings
+
+from .analytics import ALL_MONTHS
+from .kpis import BALANCE_SHEET_ACCOUNTS, SALES_ACCOUNT
+from .solver import DEFAULT_PARAMS, clean_params, solve_economics
+
+MAPPED_SIDECARS = 8  # Uploads each pool process keeps mapped between sweeps
+
+# The server process's sweep pool, shared by every request
+_pool = None
+_pool_lock = threading.Lock()
+
+# In each pool process: sidecar path -> (memory-mapped table, per-(scenario, year)
+# unit economics derived from it), least recently used first. Sidecars are named
+# by content hash, so an entry never goes stale.
+_mapped = OrderedDict()
+
+
+def grid_axis(name, values):
+    """The values swept for one parameter; a single value is an axis of one."""
+    if not isinstance(values, list):
+        return [values]
+    # price_points is itself a list, so sweeping it takes a list of lists
+    if name == 'price_points' and not all(isinstance(value, list) for value in values):
+        return [values]
+    return values
+
+
+def expand_grid(grid, scenarios, limit):
+    """Every combination of a {parameter: [values]} grid, as cleaned solver parameters.
+
+    Sweeps every scenario in the upload unless the grid names some.
+    Raises ValueError for unknown parameters, bad values or oversized grids.
+    """
+    if not isinstance(grid, dict):
+        raise ValueError('grid must be an object of parameter: [values]')
+    unknown = set(grid) - set(DEFAULT_PARAMS)
+    if unknown:
+        raise ValueError(f"Unknown parameters: {', '.join(sorted(unknown))}")
+
+    axes = {name: grid_axis(name, values) for name, values in {'scenario': scenarios, **grid}.items()}
+    size = 1
+    for values in axes.values():
+        size *= len(values)
+    if size > limit:
+        raise ValueError(f'The grid has {size} scenarios; the limit is {limit}')
+    return [clean_params(dict(zip(axes, combination))) for combination in itertools.product(*axes.values())]
+
+
+def table_scenarios(table):
+    return sorted(pc.unique(table['Scenario'].drop_null()).to_pylist())
+
+
+def table_economics(table, scenario, year=None):
+    """Revenue and cost per business unit, computed with Arrow kernels on the mapped table.
+
+    Same figures as solver.unit_economics reads from the DuckDB rollups.
+    """
+    years = pc.cast(table['Year'], pa.string())
+    in_scenario = pc.equal(table['Scenario'], scenario)
+    if year is None:
+        year = pc.max(pc.filter(years, in_scenario)).as_py()
+    rows = table.filter(pc.and_(in_scenario, pc.equal(years, str(year))))
+
+    months = [pc.fill_null(pc.cast(rows[month], pa.float64()), 0.0) for month in ALL_MONTHS]
+    amount = months[0]
+    absolute = pc.abs(months[0])
+    for month in months[1:]:
+        amount = pc.add(amount, month)
+        absolute = pc.add(absolute, pc.abs(month))
+
+    account = rows['Account']
+    is_sales = pc.fill_null(pc.equal(account, SALES_ACCOUNT), False)
+    is_cost = pc.invert(pc.fill_null(pc.is_in(account, pa.array([SALES_ACCOUNT, *BALANCE_SHEET_ACCOUNTS])), True))
+    units = pa.table({
+        'business_unit': rows['business_unit'],
+        'revenue': pc.if_else(is_sales, amount, 0.0),
+        'cost': pc.if_else(is_cost, absolute, 0.0),
+    }).group_by('business_unit').aggregate([('revenue', 'sum'), ('cost', 'sum')]).sort_by('business_unit')
+    return (
+        units['business_unit'].to_pylist(),
+        units['revenue_sum'].to_numpy(),
+        units['cost_sum'].to_numpy(),
+        year,
+    )
+
+
+def mapped(sidecar):
+    """The sidecar's table and economics cache in this pool process, mapping it on first use."""
+    if sidecar not in _mapped:
+        # Every process maps the same file, so the data is shared through the page cache, not pickled
+        _mapped[sidecar] = (feather.read_table(sidecar, memory_map=True), {})
+        while len(_mapped) > MAPPED_SIDECARS:
+            _mapped.popitem(last=False)
+    _mapped.move_to_end(sidecar)
+    return _mapped[sidecar]
+
+
+def run_scenario(sidecar, index, params):
+    table, economics = mapped(sidecar)
+    key = (params['scenario'], params['year'])
+    if key not in economics:
+        economics[key] = table_economics(table, *key)
+    units, revenue, cost, year = economics[key]
+    return {'index': index, **solve_economics(units, revenue, cost, year, params)}
+
+
+def process_pool():
+    """The shared sweep pool of SWEEP_WORKERS processes, started on first use or after a worker died."""
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool._broken:
+            _pool = ProcessPoolExecutor(max_workers=settings.SWEEP_WORKERS)
+        return _pool
+
+
+def sweep(sidecar, scenarios, workers):
+    """Run scenarios on the shared process pool, yielding each result as soon as it finishes.
+
+    At most `workers` of this sweep's scenarios are in flight at once, so one
+    request can't take over the pool.
+    """
+    pool = process_pool()
+    queued = enumerate(scenarios)
+    pending = {pool.submit(run_scenario, sidecar, index, params) for index, params in itertools.islice(queued, workers)}
+    try:
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                # Keep the pool busy while the result goes out
+                for index, params in itertools.islice(queued, 1):
+                    pending.add(pool.submit(run_scenario, sidecar, index, params))
+                yield future.result()
+    finally:
+        # Also runs when the client disconnects mid-stream
+        for future in pending:
+            future.cancel()
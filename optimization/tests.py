@@ -1,3 +1,673 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+from unittest import mock
 
-# Create your tests here.
+import duckdb
+import numpy as np
+import openpyxl
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from . import analytics, sweeps, uploads
+from .aggregates import RESERVOIR_SIZE, summarize_batches
+from .blocking import iterate_blocking
+from .analytics import ALL_MONTHS, build_cube, update_cube
+from .dashboard import dashboard_cache_key, dashboard_context
+from .digests import ResumableSHA256
+from .downsampling import lttb_indices, minmax_indices, resolution_levels
+from .encoding import COMPACT_MIN_LENGTH, decode_array, decode_payload, encode_range, encode_series
+from .ingest import ingest, stream_excel_to_arrow, write_batches
+from .jobs import claim_next, enqueue, run_job
+from .models import OptimizationData, ProcessingJob, Subscription, UploadSession
+from .uploads import partial_path, session_lock
+from .utils import generate_excel_dashboard
+
+
+def write_workbook(path, header, rows):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(header)
+    for row in rows:
+        ws.append(row)
+    wb.save(path)
+
+
+def financial_csv(units=('North', 'South'), years=(2023, 2024), scale=1.0):
+    """A small upload in the Scenario / business_unit / Account / Year / month layout."""
+    lines = [','.join(['Scenario', 'business_unit', 'Account', 'Year', *ALL_MONTHS])]
+    for year in years:
+        for number, unit in enumerate(units, start=1):
+            for account, base in (('Sales', 1000), ('Cost of Goods Sold', -400), ('Payroll', -200)):
+                amounts = [str(base * number * scale + month) for month in range(12)]
+                lines.append(','.join(['Actuals', unit, account, str(year), *amounts]))
+    return ('\n'.join(lines) + '\n').encode()
+
+
+def stream_chunks(response):
+    """The chunks of an async streaming response, in order."""
+    async def read():
+        return [chunk async for chunk in response.streaming_content]
+    return async_to_sync(read)()
+
+
+class MediaTestCase(TestCase):
+    """Runs against a throwaway MEDIA_ROOT and an in-memory cache."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        media = override_settings(
+            MEDIA_ROOT=self.tmp.name,
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+        )
+        media.enable()
+        self.addCleanup(media.disable)
+        self.addCleanup(cache.clear)  # Entitlements and dashboard contexts are cached by user id
+        self.user = User.objects.create_user('owner', 'owner@example.com', 'password')
+
+    def upload(self, name, content, user=None):
+        optimization_data = OptimizationData(user=user or self.user, original_name=name)
+        optimization_data.file.save(name, ContentFile(content), save=False)
+        optimization_data.save()
+        return optimization_data
+
+    def process(self, optimization_data):
+        job = enqueue(optimization_data)
+        job.status = 'running'
+        return run_job(job)
+
+
+@override_settings(INGEST_CHUNK_ROWS=1000)
+class StreamExcelToArrowTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.source = os.path.join(self.tmp.name, 'upload.xlsx')
+        self.target = os.path.join(self.tmp.name, 'columnar', 'upload.arrow')
+
+    def test_later_fraction_widens_integer_column(self):
+        rows = [[index, 10.0] for index in range(2500)]
+        rows[1500][1] = 12.75
+        write_workbook(self.source, ['id', 'price'], rows)
+
+        summary = stream_excel_to_arrow(self.source, self.target)
+        table = feather.read_table(self.target)
+        self.assertEqual(str(table.schema.field('price').type), 'double')
+        self.assertEqual(table['price'][1500].as_py(), 12.75)
+        self.assertEqual(table['price'].null_count, 0)
+        self.assertEqual(summary['describe']['price']['sum'], 25002.75)
+        self.assertEqual(summary['rows'], 2500)
+
+    def test_later_text_widens_numeric_column(self):
+        rows = [[index, index * 2] for index in range(1500)]
+        rows[1200][1] = 'n/a'
+        write_workbook(self.source, ['id', 'amount'], rows)
+
+        stream_excel_to_arrow(self.source, self.target)
+        table = feather.read_table(self.target)
+        self.assertEqual(str(table.schema.field('amount').type), 'string')
+        self.assertEqual(table['amount'][1200].as_py(), 'n/a')
+        self.assertEqual(table['amount'][1199].as_py(), '2398')
+        self.assertEqual(table['amount'].null_count, 0)
+
+    def test_header_only_sheet(self):
+        write_workbook(self.source, ['id', 'name'], [])
+
+        summary = stream_excel_to_arrow(self.source, self.target)
+        table = feather.read_table(self.target)
+        self.assertEqual(table.column_names, ['id', 'name'])
+        self.assertEqual(summary['rows'], 0)
+
+    def test_concurrent_writes_of_one_target(self):
+        table = pa.table({'id': list(range(1000))})
+        barrier = threading.Barrier(2)
+        errors = []
+        def write():
+            try:
+                # Both writers are mid-file before either renames
+                write_batches(self.target, table.schema, table.to_batches(max_chunksize=100), on_batch=lambda rows: barrier.wait(timeout=10))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=write) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertTrue(feather.read_table(self.target).equals(table))
+        self.assertEqual(os.listdir(os.path.dirname(self.target)), ['upload.arrow'])
+
+
+class ProcessUploadTests(MediaTestCase):
+    def three_sheet_upload(self):
+        path = os.path.join(self.tmp.name, 'source.xlsx')
+        wb = openpyxl.Workbook()
+        wb.active.append(['Date', 'Units', 'Price', 'Region'])
+        for day in range(1, 21):
+            wb.active.append([f'2024-01-{day:02d}', day, day * 1.5, 'North' if day % 2 else 'South'])
+        notes = wb.create_sheet('Notes')
+        notes.append(['note'])
+        notes.append(['checked'])
+        wb.create_sheet('Blank')
+        wb.save(path)
+        with open(path, 'rb') as fh:
+            return self.upload('three_sheets.xlsx', fh.read())
+
+    def test_blank_sheet_does_not_fail_the_job(self):
+        optimization_data = self.three_sheet_upload()
+
+        job = self.process(optimization_data)
+        self.assertEqual(job.status, 'done', job.error)
+        self.assertEqual(set(job.timings), {'ingest', 'lineage', 'charts', 'analytics', 'kpis', 'total'})
+
+    def test_export_keeps_every_sheet(self):
+        optimization_data = self.three_sheet_upload()
+        self.process(optimization_data)
+
+        _, path = generate_excel_dashboard(optimization_data)
+        wb = openpyxl.load_workbook(path, read_only=True)
+        self.assertEqual(wb.sheetnames, ['Sheet', 'Notes', 'Blank', 'Summary'])
+        self.assertEqual(len(list(wb['Sheet'].iter_rows(values_only=True))), 21)
+        self.assertEqual([row for row in wb['Notes'].iter_rows(values_only=True)], [('note',), ('checked',)])
+        wb.close()
+
+    def test_concurrent_exports_use_their_own_temp_files(self):
+        optimization_data = self.three_sheet_upload()
+        self.process(optimization_data)
+
+        # Both exports get past the cache check before either has saved
+        barrier = threading.Barrier(2)
+        save = openpyxl.Workbook.save
+        def save_together(wb, filename):
+            barrier.wait(timeout=10)
+            save(wb, filename)
+
+        errors = []
+        def export():
+            try:
+                generate_excel_dashboard(optimization_data)
+            except Exception as e:
+                errors.append(e)
+
+        with mock.patch.object(openpyxl.Workbook, 'save', save_together):
+            threads = [threading.Thread(target=export) for _ in range(2)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(errors, [])
+        _, path = generate_excel_dashboard(optimization_data)
+        self.assertEqual([name for name in os.listdir(os.path.dirname(path)) if name.endswith('.tmp')], [])
+        wb = openpyxl.load_workbook(path, read_only=True)
+        self.assertEqual(wb.sheetnames, ['Sheet', 'Notes', 'Blank', 'Summary'])
+        wb.close()
+
+    def test_narrow_upload_skips_charts_it_has_no_columns_for(self):
+        optimization_data = self.upload('tiny.csv', b'label,value\na,1\nb,2\nc,3\n')
+
+        job = self.process(optimization_data)
+        self.assertEqual(job.status, 'done', job.error)
+        self.assertEqual(set(optimization_data.visualization.values_list('chart_type', flat=True)), {'line', 'pareto'})
+
+
+class DashboardContextTests(MediaTestCase):
+    def subscribe(self, subscription_type, days):
+        return Subscription.objects.create(
+            user=self.user, country='NL', payment_method='paypal', subscription_type=subscription_type,
+            amount=10, taxes=0, total_amount=10, expiration_date=timezone.now().date() + timezone.timedelta(days=days),
+        )
+
+    def test_expired_subscription_is_not_current(self):
+        self.subscribe('yearly', -1)
+        self.assertIsNone(dashboard_context(self.user.id)['subscription'])
+
+        self.subscribe('monthly', 30)
+        self.assertEqual(dashboard_context(self.user.id)['subscription']['subscription_type'], 'monthly')
+
+    def test_cached_context_holds_plain_values(self):
+        self.subscribe('monthly', 30)
+        self.client.force_login(self.user)
+        response = self.client.get(f'/dashboard/{self.user.id}/')
+        self.assertContains(response, self.user.email)
+
+        cached = cache.get(dashboard_cache_key(self.user.id))
+        self.assertEqual(set(cached), {'subscription', 'analysis_count'})
+        self.assertNotIn(self.user.password, repr(cached))
+
+    def test_other_users_dashboard_is_not_found(self):
+        other = User.objects.create_user('other', 'other@example.com', 'password')
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(f'/dashboard/{other.id}/').status_code, 404)
+        self.assertIsNone(cache.get(dashboard_cache_key(other.id)))
+
+
+class AdmissionControlTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+        self.optimization_data = self.upload('financials.csv', financial_csv())
+
+    def test_optimize_respects_queued_job_limit(self):
+        for _ in range(5):
+            response = self.client.post(f'/api/uploads/{self.optimization_data.id}/optimize/', '{}', content_type='application/json')
+            self.assertEqual(response.status_code, 202)
+        response = self.client.post(f'/api/uploads/{self.optimization_data.id}/optimize/', '{}', content_type='application/json')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(ProcessingJob.objects.count(), 5)
+
+    def test_sweep_grid_capped_by_plan(self):
+        self.process(self.optimization_data)
+        grid = {'elasticity': [-0.5 - step / 10 for step in range(51)]}
+        response = self.client.post(f'/api/uploads/{self.optimization_data.id}/sweep/', {'grid': grid}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('the limit is 50', response.json()['errors']['grid'])
+
+        response = self.client.post(f'/api/uploads/{self.optimization_data.id}/sweep/', {'grid': {'elasticity': grid['elasticity'][:2]}}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(stream_chunks(response)), 2)
+
+    def test_sweep_streams_each_scenario_from_the_shared_pool(self):
+        self.process(self.optimization_data)
+        url = f'/api/uploads/{self.optimization_data.id}/sweep/'
+        grid = {'elasticity': [-0.5, -1.0, -1.5, -2.0]}
+
+        response = self.client.post(url, {'grid': grid}, content_type='application/json')
+        self.assertTrue(response.is_async)  # Streamed under ASGI instead of collected first
+        chunks = stream_chunks(response)
+        # One chunk per finished scenario
+        self.assertEqual(sorted(json.loads(chunk)['index'] for chunk in chunks), [0, 1, 2, 3])
+        pool = sweeps.process_pool()
+
+        response = self.client.post(url, {'grid': grid}, content_type='application/json')
+        self.assertEqual(len(stream_chunks(response)), 4)
+        self.assertIs(sweeps.process_pool(), pool)
+
+    def small_plan(self, max_upload_bytes):
+        tiers = {tier: dict(limits) for tier, limits in settings.ENTITLEMENT_TIERS.items()}
+        tiers['free']['max_upload_bytes'] = max_upload_bytes
+        return override_settings(ENTITLEMENT_TIERS=tiers)
+
+    def test_oversized_upload_refused_before_parsing(self):
+        upload = ContentFile(financial_csv() * 200, name='financials.csv')
+        with self.small_plan(20_000), mock.patch('django.http.request.MultiPartParser') as parser:
+            response = self.client.post('/upload/', {'file': upload})
+        self.assertEqual(response.status_code, 413)
+        parser.assert_not_called()
+
+    def test_parsed_size_is_checked_too(self):
+        # Within the allowance for the multipart envelope, so only the parsed size catches it
+        upload = ContentFile(b'label,value\n' + b'a,1\n' * 6_000, name='labels.csv')
+        with self.small_plan(20_000):
+            response = self.client.post('/upload/', {'file': upload})
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(OptimizationData.objects.count(), 1)
+
+
+@override_settings(JOB_POLL_INTERVAL=0.05, DASHBOARD_EVENTS_MAX_DURATION=1)
+class DashboardEventsTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.optimization_data = self.upload('financials.csv', financial_csv())
+        self.job = enqueue(self.optimization_data)
+        self.url = f'/excel_dashboard/events/{self.optimization_data.id}/'
+
+    def test_wsgi_sends_one_snapshot(self):
+        self.client.force_login(self.user)
+        response = self.client.get(self.url)
+        with self.assertWarns(Warning):  # WSGI has to buffer the async stream
+            content = b''.join(response).decode()
+        self.assertTrue(content.startswith('retry: 50\n\n'))
+        self.assertEqual(content.count('event: progress'), 1)
+        self.assertIn('"status": "queued"', content)
+
+    async def test_asgi_pushes_progress_until_the_stream_expires(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(self.url)
+        events = aiter(response.streaming_content)
+        self.assertEqual(await anext(events), b'retry: 50\n\n')
+        self.assertIn(b'"status": "queued"', await anext(events))
+
+        await ProcessingJob.objects.filter(id=self.job.id).aupdate(status='running', progress={'rows_parsed': 10})
+        self.assertIn(b'"rows_parsed": 10', await asyncio.wait_for(anext(events), 5))
+
+        # Still running when DASHBOARD_EVENTS_MAX_DURATION is up, so the stream just ends
+        remaining = [event async for event in events]
+        self.assertEqual(remaining, [])
+
+
+class JobQueueTests(MediaTestCase):
+    def test_users_at_their_running_limit_do_not_starve_others(self):
+        busy = self.upload('busy.csv', financial_csv())
+        ProcessingJob.objects.create(optimization_data=busy, status='running')
+        # A long backlog from the same user, all ahead of the other user's job
+        ProcessingJob.objects.bulk_create(ProcessingJob(optimization_data=busy, priority=10) for _ in range(100))
+        other = User.objects.create_user('other', 'other@example.com', 'password')
+        waiting = enqueue(self.upload('waiting.csv', financial_csv(), user=other))
+
+        self.assertEqual(claim_next('test-worker'), waiting)
+        self.assertIsNone(claim_next('test-worker'))
+
+
+class SharedChartTests(MediaTestCase):
+    def test_identical_upload_keeps_charts_after_first_is_deleted(self):
+        other = User.objects.create_user('other', 'other@example.com', 'password')
+        first = self.upload('financials.csv', financial_csv(), user=other)
+        self.process(first)
+        second = self.upload('financials.csv', financial_csv())
+        self.process(second)
+        self.assertEqual(second.visualization.count(), first.visualization.count())
+
+        first.delete()
+        self.client.force_login(self.user)
+        charts = self.client.get(f'/api/uploads/{second.id}/charts/').json()['charts']
+        self.assertTrue(charts)
+        response = self.client.get(charts[0]['url'])
+        self.assertEqual(response.status_code, 200)
+
+
+class UploadSessionTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+        self.content = financial_csv()
+        response = self.client.post('/api/upload-sessions/', {'filename': 'financials.csv', 'size': len(self.content)}, content_type='application/json')
+        self.session = UploadSession.objects.get(id=response.json()['id'])
+        self.url = response.json()['url']
+
+    def put(self, start, chunk):
+        return self.client.put(
+            self.url, chunk, content_type='application/octet-stream',
+            headers={'Content-Range': f'bytes {start}-{start + len(chunk) - 1}/{len(self.content)}'},
+        )
+
+    def test_chunk_written_concurrently_is_rejected(self):
+        self.assertEqual(self.put(0, self.content[:100]).status_code, 200)
+        with session_lock(self.session):
+            response = self.put(100, self.content[100:200])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['received'], 100)
+        with open(partial_path(self.session), 'rb') as fh:
+            self.assertEqual(fh.read(), self.content[:100])
+
+        self.assertEqual(self.put(100, self.content[100:]).status_code, 202)
+        optimization_data = UploadSession.objects.get(pk=self.session.pk).optimization_data
+        with optimization_data.file.open('rb') as fh:
+            self.assertEqual(fh.read(), self.content)
+
+    def test_stale_offset_is_rejected(self):
+        self.assertEqual(self.put(0, self.content[:100]).status_code, 200)
+        self.assertEqual(self.put(0, self.content[:100]).status_code, 409)
+
+    def test_digest_resumes_from_the_saved_state(self):
+        self.assertEqual(self.put(0, self.content[:100]).status_code, 200)
+        self.session.refresh_from_db()
+        self.assertTrue(self.session.digest_state)
+        self.assertEqual(self.put(100, self.content[100:300]).status_code, 200)
+
+        # Resuming must not rehash the partial file, here or in another process
+        with mock.patch('optimization.uploads.open', wraps=open) as opened:
+            self.assertEqual(self.put(300, self.content[300:]).status_code, 202)
+        self.assertNotIn(mock.call(partial_path(self.session), 'rb'), opened.call_args_list)
+        optimization_data = UploadSession.objects.get(pk=self.session.pk).optimization_data
+        self.assertEqual(optimization_data.content_hash, hashlib.sha256(self.content).hexdigest())
+
+    def test_digest_without_libcrypto(self):
+        with mock.patch.object(uploads, 'resumable', return_value=False):
+            self.assertEqual(self.put(0, self.content[:100]).status_code, 200)
+            self.assertEqual(self.put(100, self.content[100:]).status_code, 202)
+        optimization_data = UploadSession.objects.get(pk=self.session.pk).optimization_data
+        self.assertEqual(optimization_data.content_hash, hashlib.sha256(self.content).hexdigest())
+
+    async def test_chunks_over_asgi(self):
+        await self.async_client.aforce_login(self.user)
+        for start, end in ((0, 250), (250, len(self.content))):
+            response = await self.async_client.put(
+                self.url, self.content[start:end], content_type='application/octet-stream',
+                headers={'Content-Range': f'bytes {start}-{end - 1}/{len(self.content)}'},
+            )
+        self.assertEqual(response.status_code, 202)
+        session = await UploadSession.objects.select_related('optimization_data').aget(pk=self.session.pk)
+        self.assertEqual(session.optimization_data.content_hash, hashlib.sha256(self.content).hexdigest())
+
+    def test_completion_respects_queued_job_limit(self):
+        jobs = [enqueue(self.upload(f'other-{number}.csv', financial_csv(scale=number))) for number in range(1, 6)]
+        response = self.put(0, self.content)
+        self.assertEqual(response.status_code, 429)
+        self.session.refresh_from_db()
+        self.assertEqual((self.session.status, self.session.received), ('open', len(self.content)))
+
+        ProcessingJob.objects.filter(id=jobs[0].id).update(status='done')
+        response = self.client.post(f'{self.url}complete/')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(ProcessingJob.objects.filter(status='queued').count(), 5)
+
+
+class AnalyticsConnectionTests(MediaTestCase):
+    def test_lazy_build_does_not_block_other_uploads(self):
+        ready = self.upload('ready.csv', financial_csv())
+        self.process(ready)
+        pending = self.upload('pending.csv', financial_csv(scale=2.0))
+        ingest(pending)  # Parsed, but its database is built lazily below
+
+        building, release = threading.Event(), threading.Event()
+        build_database = analytics.build_database
+
+        def slow_build(optimization_data):
+            building.set()
+            release.wait(10)
+            return build_database(optimization_data)
+
+        with mock.patch.object(analytics, 'build_database', slow_build):
+            builder = threading.Thread(target=analytics.get_cursor, args=(pending,))
+            builder.start()
+            self.assertTrue(building.wait(10))
+            results = []
+            reader = threading.Thread(target=lambda: results.append(analytics.query(ready, 'SELECT COUNT(*) AS n FROM data')))
+            reader.start()
+            reader.join(5)
+            finished_during_build = not reader.is_alive()
+            release.set()
+            builder.join()
+            reader.join()
+        self.assertTrue(finished_during_build)
+        self.assertEqual(results[0]['n'].iloc[0], 12)
+
+
+class IterateBlockingTests(SimpleTestCase):
+    def test_closing_early_closes_the_iterator(self):
+        closed = threading.Event()
+        def numbers():
+            try:
+                yield from range(1_000)
+            finally:
+                closed.set()
+
+        async def take_two():
+            items = iterate_blocking(numbers())
+            taken = [await anext(items), await anext(items)]
+            await items.aclose()
+            return taken
+
+        self.assertEqual(async_to_sync(take_two)(), [0, 1])
+        self.assertTrue(closed.wait(5))
+
+
+class ResumableSHA256Tests(SimpleTestCase):
+    def test_saved_state_resumes_to_the_hashlib_digest(self):
+        data = os.urandom(200_003)
+        digest = ResumableSHA256()
+        for start in range(0, len(data), 65_537):
+            digest = ResumableSHA256(digest.state())
+            digest.update(data[start:start + 65_537])
+        self.assertEqual(digest.hexdigest(), hashlib.sha256(data).hexdigest())
+        self.assertEqual(digest.hexdigest(), hashlib.sha256(data).hexdigest())  # Reading the digest doesn't finalise it
+
+    def test_foreign_state_is_rejected(self):
+        with self.assertRaises(ValueError):
+            ResumableSHA256(b'not a state')
+
+
+class DownsamplingTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.y = np.sin(np.linspace(0, 20, 10_000)) + rng.normal(0, 0.05, 10_000)
+        self.y[4321] = 25.0  # A spike any faithful downsample must keep
+
+    def test_lttb_keeps_endpoints_and_peaks(self):
+        indices = lttb_indices(self.y, 200)
+        self.assertEqual(len(indices), 200)
+        self.assertEqual((indices[0], indices[-1]), (0, len(self.y) - 1))
+        self.assertTrue((np.diff(indices) > 0).all())
+        self.assertIn(4321, indices)
+
+    def test_lttb_short_series_and_missing_values(self):
+        np.testing.assert_array_equal(lttb_indices([1.0, 2.0, 3.0], 200), [0, 1, 2])
+        y = self.y.copy()
+        y[::7] = np.nan
+        indices = lttb_indices(y, 500)
+        self.assertEqual(len(indices), 500)
+        self.assertFalse(np.isnan(y[indices]).any())
+
+    def test_minmax_keeps_every_bucket_extreme(self):
+        indices = minmax_indices(self.y, 200)
+        self.assertLessEqual(len(indices), 200)
+        self.assertTrue((np.diff(indices) > 0).all())
+        self.assertIn(int(np.argmax(self.y)), indices)
+        self.assertIn(int(np.argmin(self.y)), indices)
+        for bucket in np.array_split(np.arange(len(self.y)), 100):
+            self.assertIn(bucket[np.argmax(self.y[bucket])], indices)
+
+    def test_minmax_short_series_and_all_missing_bucket(self):
+        np.testing.assert_array_equal(minmax_indices([3.0, 1.0, 2.0], 200), [0, 1, 2])
+        y = np.arange(1000, dtype=float)
+        y[:100] = np.nan
+        indices = minmax_indices(y, 20)
+        self.assertFalse(np.isnan(y[indices]).any())
+        self.assertIn(999, indices)
+
+    def test_resolution_levels(self):
+        self.assertEqual(resolution_levels(100), [])
+        self.assertEqual(resolution_levels(1000), [200, 800])
+
+
+class EncodingTests(SimpleTestCase):
+    def test_long_numeric_series_round_trips_packed(self):
+        values = np.linspace(-1e6, 1e6, COMPACT_MIN_LENGTH * 4)
+        values[[3, 700]] = np.nan
+        encoded = encode_series(values)
+        self.assertIsInstance(encoded, dict)
+        self.assertEqual(encoded['length'], len(values))
+
+        decoded = decode_payload({'y': encoded})['y']
+        self.assertEqual(len(decoded), len(values))
+        self.assertIsNone(decoded[3])
+        self.assertIsNone(decoded[700])
+        np.testing.assert_array_equal(decode_array(encoded), values)
+
+    def test_short_and_text_series_stay_json_lists(self):
+        self.assertEqual(encode_series([1.5, float('nan'), 3]), [1.5, None, 3.0])
+        labels = ['a', None] * COMPACT_MIN_LENGTH
+        self.assertEqual(encode_series(labels), labels)
+        self.assertEqual(decode_payload({'labels': labels, 'y': [1.5, None]}), {'labels': labels, 'y': [1.5, None]})
+
+    def test_range_labels(self):
+        encoded = encode_range(5)
+        self.assertEqual(decode_payload({'x': encoded}), {'x': [0, 1, 2, 3, 4]})
+
+
+class RunningSummaryTests(SimpleTestCase):
+    def summarize(self, frame, batch_size):
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        return summarize_batches(table.schema, table.to_batches(max_chunksize=batch_size))
+
+    def assertMatchesDescribe(self, summary, frame, quartile_tolerance=0.0):
+        for column, expected in frame.describe().items():
+            actual = summary['describe'][column]
+            self.assertEqual(actual['count'], expected['count'])
+            self.assertAlmostEqual(actual['sum'], frame[column].sum(), delta=1e-6 * abs(frame[column].sum()))
+            for statistic in ('mean', 'std', 'min', 'max'):
+                self.assertAlmostEqual(actual[statistic], expected[statistic], delta=1e-9 * max(1.0, abs(expected[statistic])))
+            for statistic in ('25%', '50%', '75%'):
+                self.assertAlmostEqual(actual[statistic], expected[statistic], delta=quartile_tolerance or 1e-9 * max(1.0, abs(expected[statistic])))
+
+    def test_matches_describe_across_batches(self):
+        rng = np.random.default_rng(1)
+        frame = pd.DataFrame({
+            'amount': rng.normal(1e5, 2e4, 5_000),
+            'units': rng.integers(0, 50, 5_000),
+            'unit': rng.choice(['North', 'South', 'East'], 5_000),
+        })
+        frame.loc[::13, 'amount'] = np.nan
+        summary = self.summarize(frame, batch_size=777)
+
+        self.assertEqual(summary['rows'], len(frame))
+        self.assertEqual(set(summary['describe']), {'amount', 'units'})
+        self.assertMatchesDescribe(summary, frame)
+        self.assertEqual(dict(summary['value_counts']['unit']), frame['unit'].value_counts().to_dict())
+
+    def test_quartiles_are_sampled_past_the_reservoir(self):
+        frame = pd.DataFrame({'amount': np.random.default_rng(2).uniform(0, 1000, RESERVOIR_SIZE * 5)})
+        summary = self.summarize(frame, batch_size=4_096)
+        self.assertMatchesDescribe(summary, frame, quartile_tolerance=25)
+
+
+class CubeTests(SimpleTestCase):
+    def connect(self, frame):
+        con = duckdb.connect()
+        self.addCleanup(con.close)
+        self.load(con, frame)
+        return con
+
+    def load(self, con, frame):
+        """Replace the data table, binding years as strings like build_database does."""
+        con.execute('DROP TABLE IF EXISTS data')
+        con.register('source', frame)
+        con.execute('CREATE TABLE data AS SELECT * FROM source')
+        con.execute('ALTER TABLE data ALTER "Year" TYPE VARCHAR')
+        con.unregister('source')
+
+    def cube(self, con):
+        return con.execute('SELECT * FROM monthly_cube ORDER BY ALL').fetchall()
+
+    def test_update_matches_a_full_rebuild(self):
+        before = pd.read_csv(io.BytesIO(financial_csv(units=('North', 'South', 'West'))))
+        after = pd.read_csv(io.BytesIO(financial_csv(units=('North', 'South', 'East'))))
+        changed = (after['business_unit'] == 'North') & (after['Account'] == 'Sales') & (after['Year'] == 2024)
+        after.loc[changed, 'Mar'] += 500
+        stale = [
+            ('Actuals', 'North', 'Sales', '2024'),  # changed
+            *[('Actuals', 'East', account, str(year)) for account in ('Sales', 'Cost of Goods Sold', 'Payroll') for year in (2023, 2024)],  # added
+            *[('Actuals', 'West', account, str(year)) for account in ('Sales', 'Cost of Goods Sold', 'Payroll') for year in (2023, 2024)],  # removed
+        ]
+
+        con = self.connect(before)
+        build_cube(con)
+        self.load(con, after)
+        update_cube(con, stale)
+
+        rebuilt = self.connect(after)
+        build_cube(rebuilt)
+        self.assertEqual(self.cube(con), self.cube(rebuilt))
+
+    def test_update_without_stale_partitions_keeps_the_cube(self):
+        con = self.connect(pd.read_csv(io.BytesIO(financial_csv())))
+        build_cube(con)
+        expected = self.cube(con)
+        update_cube(con, [])
+        self.assertEqual(self.cube(con), expected)
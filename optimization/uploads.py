@@ -0,0 +1,228 @@
+import fcntl
+import hashlib
+import os
+import zipfile
+from contextlib import contextmanager
+
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+
+from .digests import ResumableSHA256, resumable
+from .ingest import sniff_format
+
+UPLOAD_DIR = 'uploads'
+
+
+class HashingMixin:
+    """Hash an uploaded file chunk by chunk as Django streams it in.
+
+    The finished UploadedFile carries the hex digest as `content_hash`, so the
+    bytes never have to be read a second time just to be hashed.
+    """
+
+    def new_file(self, *args, **kwargs):
+        self.digest = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        self.digest.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        uploaded_file = super().file_complete(file_size)
+        if uploaded_file is not None:
+            uploaded_file.content_hash = self.digest.hexdigest()
+        return uploaded_file
+
+
+class HashingMemoryFileUploadHandler(HashingMixin, MemoryFileUploadHandler):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(HashingMixin, TemporaryFileUploadHandler):
+    pass
+
+
+def upload_extension(name):
+    name = name.lower()
+    return '.csv.gz' if name.endswith('.csv.gz') else os.path.splitext(name)[1]
+
+
+def upload_format(uploaded_file):
+    """Sniff an uploaded file's format from its leading bytes, leaving it rewound."""
+    head = uploaded_file.read(8)
+    uploaded_file.seek(0)
+    return sniff_format(head)
+
+
+def store_upload(uploaded_file):
+    """Save an upload under its content hash, reusing the stored copy of identical bytes.
+
+    Returns (storage name, content hash).
+    """
+    content_hash = getattr(uploaded_file, 'content_hash', None)
+    if content_hash is None:
+        digest = hashlib.sha256()
+        for chunk in uploaded_file.chunks():
+            digest.update(chunk)
+        content_hash = digest.hexdigest()
+
+    name = content_name(content_hash, uploaded_file.name)
+    if not default_storage.exists(name):
+        name = default_storage.save(name, uploaded_file)
+    return name, content_hash
+
+
+class UploadError(Exception):
+    pass
+
+
+class UploadConflict(Exception):
+    """Another request is already writing a chunk of the same session."""
+
+
+PARTIAL_DIR = f'{UPLOAD_DIR}/partial'
+READ_BLOCK_SIZE = 64 * 1024
+# UploadSession fields append_chunk updates
+CHUNK_FIELDS = ['received', 'file_format', 'digest_state', 'updated_at']
+
+
+def content_name(content_hash, filename):
+    return f'{UPLOAD_DIR}/{content_hash}{upload_extension(filename)}'
+
+
+def partial_path(session):
+    return default_storage.path(f'{PARTIAL_DIR}/{session.id}.part')
+
+
+def lock_path(session):
+    return f'{partial_path(session)}.lock'
+
+
+@contextmanager
+def session_lock(session):
+    """Hold an exclusive lock on the session's partial file while a chunk is written or the session completes.
+
+    The lock is not waited for: a second request for the same session raises
+    UploadConflict, so taking it never blocks an event loop. Callers re-read the session once they hold it, since
+    another request may have moved it on in the meantime.
+    """
+    path = lock_path(session)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd = os.open(path, os.O_CREAT | os.O_RDWR)
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise UploadConflict('Another chunk of this upload is being written')
+        yield
+    finally:
+        os.close(fd)  # Also releases the lock
+
+
+def session_digest(session):
+    """The SHA-256 of the session's received bytes so far, resumed from the state saved on the session.
+
+    Without a usable saved state the partial file is hashed once instead.
+    """
+    if session.digest_state:
+        try:
+            return ResumableSHA256(bytes(session.digest_state))
+        except ValueError:
+            pass  # Saved by a different build; rehash below
+
+    digest = ResumableSHA256() if resumable() else hashlib.sha256()
+    with open(partial_path(session), 'rb') as fh:
+        remaining = session.received
+        while remaining:
+            block = fh.read(min(READ_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            digest.update(block)
+            remaining -= len(block)
+    return digest
+
+
+def append_chunk(session, stream):
+    """Append one chunk read from `stream` to the session's partial file, hashing it as it goes.
+
+    The partial file lives in upload storage, so completing the session is a
+    rename rather than a copy. Anything past `received` (left by a chunk that
+    was cut off) is discarded first, which is what makes retries safe.
+
+    Sets the session's CHUNK_FIELDS but leaves saving them to the caller, so
+    this can run off the event loop. The running digest is saved with
+    `received`, so any process can take the next chunk.
+    """
+    path = partial_path(session)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if not resumable():
+        digest = None  # Hashed once by finish_session instead
+    elif session.received == 0:
+        digest = ResumableSHA256()
+    else:
+        digest = session_digest(session)
+
+    received = session.received
+    with open(path, 'r+b' if received else 'wb') as fh:
+        fh.truncate(received)
+        fh.seek(received)
+        for block in iter(lambda: stream.read(READ_BLOCK_SIZE), b''):
+            if received == 0:
+                session.file_format = sniff_format(block[:8]) or ''
+                if not session.file_format:
+                    raise UploadError('Upload an .xlsx, .csv, .csv.gz or .parquet file')
+            received += len(block)
+            if received > session.size:
+                raise UploadError(f'Received more than the declared {session.size} bytes')
+            if digest is not None:
+                digest.update(block)
+            fh.write(block)
+
+    session.received = received
+    session.digest_state = digest.state() if digest is not None else b''
+
+
+def validate_structure(path, file_format):
+    """Cheap structural checks that catch truncated or mislabelled files before they're queued."""
+    if file_format == 'xlsx':
+        try:
+            with zipfile.ZipFile(path) as archive:
+                names = set(archive.namelist())
+        except zipfile.BadZipFile:
+            raise UploadError('The workbook is not a valid .xlsx file')
+        if 'xl/workbook.xml' not in names:
+            raise UploadError('The archive does not contain an Excel workbook')
+    elif file_format == 'parquet':
+        with open(path, 'rb') as fh:
+            fh.seek(-4, os.SEEK_END)
+            if fh.read(4) != b'PAR1':
+                raise UploadError('The Parquet file is truncated')
+
+
+def remove_session_files(session):
+    for path in (partial_path(session), lock_path(session)):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def discard_session(session):
+    remove_session_files(session)
+
+
+def finish_session(session):
+    """Validate a fully received session and move it into content-addressed storage.
+
+    Returns (storage name, content hash).
+    """
+    path = partial_path(session)
+    validate_structure(path, session.file_format)
+    content_hash = session_digest(session).hexdigest()
+
+    name = content_name(content_hash, session.filename)
+    if not default_storage.exists(name):
+        os.replace(path, default_storage.path(name))
+    remove_session_files(session)  # Leftovers when identical bytes are already stored
+    return name, content_hash
@@ -12,6 +12,21 @@ urlpatterns = [
     path('dashboard/<int:user_id>/', views.dashboard, name='dashboard'),
     path('upload/', views.upload_excel, name='upload_excel'), 
     path('excel_dashboard/', views.excel_dashboard, name='excel_dashboard'),
+    path('excel_dashboard/<int:upload_id>/', views.excel_dashboard, name='excel_dashboard'),
+    path('excel_dashboard/events/', views.dashboard_events, name='dashboard_events'),
+    path('excel_dashboard/events/<int:upload_id>/', views.dashboard_events, name='dashboard_events'),
+    path('jobs/<int:job_id>/', views.job_status, name='job_status'),
+    path('api/upload-sessions/', views.create_upload_session, name='create_upload_session'),
+    path('api/upload-sessions/<uuid:session_id>/', views.upload_session, name='upload_session'),
+    path('api/upload-sessions/<uuid:session_id>/complete/', views.complete_upload_session, name='complete_upload_session'),
+    path('charts/', views.chart_dashboard, name='chart_dashboard'),
+    path('charts/<int:upload_id>/', views.chart_dashboard, name='chart_dashboard'),
+    path('api/uploads/<int:upload_id>/charts/', views.chart_types, name='chart_types'),
+    path('api/uploads/<int:upload_id>/optimize/', views.optimize_upload, name='optimize_upload'),
+    path('api/uploads/<int:upload_id>/results/', views.optimization_results, name='optimization_results'),
+    path('api/uploads/<int:upload_id>/sweep/', views.scenario_sweep, name='scenario_sweep'),
+    path('api/uploads/<int:upload_id>/export/', views.export_dashboard, name='export_dashboard'),
+    path('api/uploads/<int:upload_id>/charts/<str:chart_type>/', views.chart_data, name='chart_data'),
 
    ]
 if settings.DEBUG:
@@ -1,34 +1,191 @@
+import json
+import os
+import re
+import tempfile
+
 import pandas as pd
 import openpyxl
-from openpyxl.utils.dataframe import dataframe_to_rows
 from openpyxl.chart import BarChart, Reference
+from django.conf import settings
+from django.core import signing
+from django.db import transaction
+from .downsampling import downsample_indices, resolution_levels
+from .encoding import encode_range, encode_series
+from .ingest import load_table, upload_summary
+from .models import VisualizationData
+
+EXPORT_DIR = 'exports'
+EXPORT_VERSION = 2  # Bump when the export layout changes so cached files are regenerated
+CHART_TYPES = ('line', 'bar', 'pie', 'column', 'pareto')  # Order the charts are stored, and listed, in
+SUMMARY_STATS = ('count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max')
+
+def export_path(optimization_data):
+    return os.path.join(settings.MEDIA_ROOT, EXPORT_DIR, f'{optimization_data.content_hash}-v{EXPORT_VERSION}.xlsx')
 
-def generate_excel_dashboard(file_path):
-    # Read the Excel file into a pandas DataFrame
-    df = pd.read_excel(file_path)
+def sheet_title(name):
+    """An Excel-safe worksheet title: at most 31 characters, none of []:*?/\\."""
+    return re.sub(r'[\[\]:*?/\\]', '_', name)[:31] or 'Data'
 
-    # Perform some simple analysis (e.g., summing values in a column)
-    summary = df.describe()  # Summary statistics
-    analysis_result = summary.to_json()  # Save the result as JSON (or any format)
+def generate_excel_dashboard(optimization_data):
+    """Write every sheet of the upload plus a summary sheet and chart to an .xlsx, cached by content hash.
 
-    # Open the Excel file with openpyxl to create visualizations
-    wb = openpyxl.load_workbook(file_path)
-    ws = wb.active
+    Rows stream from the memory-mapped sidecar into a write-only workbook, and
+    the summary comes from the stats computed at ingest, so nothing is parsed
+    or described again. Repeat exports of the same bytes reuse the file.
+    """
+    table = load_table(optimization_data)  # Also fills in content_hash
+    summary = upload_summary(optimization_data)
+    analysis_result = json.dumps(summary['describe'])
+    target = export_path(optimization_data)
+    if os.path.exists(target):
+        return analysis_result, target
 
-    # Add a summary sheet
+    wb = openpyxl.Workbook(write_only=True)
+    # Every sheet of the upload, in workbook order; the chart goes on the first
+    sheets = optimization_data.sheets or [{'index': 0, 'name': 'Data'}]
+    for sheet in sheets:
+        sheet_table = table if sheet['index'] == 0 else load_table(optimization_data, sheet['index'])
+        sheet_ws = wb.create_sheet(sheet_title(sheet['name']))
+        if sheet['index'] == 0:
+            ws = sheet_ws
+        if not sheet_table.num_columns:
+            continue  # Blank sheet
+        sheet_ws.append(sheet_table.column_names)
+        for batch in sheet_table.to_batches(max_chunksize=settings.INGEST_CHUNK_ROWS):
+            for row in zip(*(column.to_pylist() for column in batch.columns)):
+                sheet_ws.append(row)
+
+    # Same layout as DataFrame.describe(): one row per statistic, one column per numeric column
     summary_sheet = wb.create_sheet("Summary")
-    for r in dataframe_to_rows(df.describe(), index=True, header=True):
-        summary_sheet.append(r)
+    columns = list(summary['describe'])
+    summary_sheet.append([None] + columns)
+    for stat in SUMMARY_STATS:
+        summary_sheet.append([stat] + [summary['describe'][column].get(stat) for column in columns])
+
+    if table.num_columns > 1 and table.num_rows:
+        chart = BarChart()
+        data = Reference(ws, min_col=2, min_row=1, max_row=table.num_rows + 1, max_col=table.num_columns)
+        chart.add_data(data, titles_from_data=True)
+        chart.title = "Data Visualization"
+        ws.add_chart(chart, "E5")
+
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    # A unique temp file per export, so concurrent exports of the same bytes never share one
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.tmp')
+    os.close(fd)
+    try:
+        wb.save(tmp_path)
+        os.replace(tmp_path, target)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return analysis_result, target
+
+DASHBOARD_TOKEN_SALT = 'optimization.streamlit-dashboard'
+DASHBOARD_TOKEN_MAX_AGE = 12 * 60 * 60  # Seconds
+
+def dashboard_token(user):
+    """Signed token that tells the Streamlit dashboard which user is viewing it."""
+    return signing.dumps({'user_id': user.id}, salt=DASHBOARD_TOKEN_SALT)
+
+def user_id_from_token(token):
+    try:
+        return signing.loads(token, salt=DASHBOARD_TOKEN_SALT, max_age=DASHBOARD_TOKEN_MAX_AGE)['user_id']
+    except (signing.BadSignature, KeyError, TypeError):
+        return None
+
+def process_excel_file(optimization_data):
+    """Process the Excel file and save data for visualizations. Returns the number of chart rows saved."""
+    table = load_table(optimization_data)  # Memory-mapped; columns are only read when used
+    summary = upload_summary(optimization_data)
+
+    def column(index):
+        series = table.column(index).to_pandas()
+        if pd.api.types.is_datetime64_any_dtype(series):
+            series = series.dt.strftime('%Y-%m-%d')  # Convert to string format
+        return series
+
+    def counts_for(index):
+        # Counted incrementally at ingest; recounted only for high-cardinality columns
+        pairs = summary['value_counts'].get(table.column_names[index])
+        if pairs is None:
+            return column(index).value_counts()
+        return pd.Series([count for _, count in pairs], index=[value for value, _ in pairs], dtype='int64')
+
+    # Example processing for charts; a chart whose column the upload doesn't have is skipped
+    charts, downsampled = {}, {}
+    if table.num_columns > 1:
+        line_data = column(1)  # Assuming the first column for line chart
+        charts['line'] = {'labels': encode_range(len(line_data)), 'values': encode_series(line_data)}
+        downsampled['line'] = (pd.Series(range(len(line_data))), line_data, 'lttb')
+
+        # Create Pareto chart data (frequency + cumulative percentage)
+        value_counts = counts_for(1).sort_index()  # Frequency
+        pareto_data = value_counts.cumsum() / value_counts.sum() * 100  # Cumulative percentage
+        charts['pareto'] = {
+            'labels': encode_series(value_counts.index),  # X-axis labels
+            'frequency_values': encode_series(value_counts),  # Bar data
+            'cumulative_values': encode_series(pareto_data),  # Line data (cumulative percentage)
+        }
+
+    if table.num_columns > 2:
+        bar_data = column(2)    # Assuming the second column for bar chart
+        charts['bar'] = {'labels': encode_range(len(bar_data)), 'values': encode_series(bar_data)}
+        downsampled['bar'] = (pd.Series(range(len(bar_data))), bar_data, 'minmax')
+
+        # Column chart data (assuming you want to use the first two columns)
+        column_data_labels = line_data  # First column as labels
+        column_data_values = bar_data  # Second column as values
+        charts['column'] = {'labels': encode_series(column_data_labels), 'values': encode_series(column_data_values)}
+        downsampled['column'] = (column_data_labels, column_data_values, 'minmax')
+
+    if table.num_columns > 3:
+        pie_data = counts_for(3)  # Assuming the third column for pie chart
+        charts['pie'] = {'labels': encode_series(pie_data.index), 'values': encode_series(pie_data)}
+
+    rows = [
+        VisualizationData(optimization_data=optimization_data, chart_type=chart_type, data=charts[chart_type])
+        for chart_type in CHART_TYPES if chart_type in charts
+    ]
+
+    # Long series also get downsampled levels so the browser never gets every row
+    for chart_type, (labels, values, mode) in downsampled.items():
+        if values.dtype.kind not in 'biuf':
+            continue  # Text columns have no shape to preserve
+        for level in resolution_levels(len(values)):
+            keep = downsample_indices(values, level, mode)
+            rows.append(VisualizationData(
+                optimization_data=optimization_data,
+                chart_type=chart_type,
+                resolution=level,
+                data={
+                    'labels': encode_series(labels.iloc[keep]),
+                    'values': encode_series(values.iloc[keep]),
+                },
+            ))
 
-    # Create a BarChart as a visualization
-    chart = BarChart()
-    data = Reference(ws, min_col=2, min_row=1, max_row=ws.max_row, max_col=ws.max_column)
-    chart.add_data(data, titles_from_data=True)
-    chart.title = "Data Visualization"
-    ws.add_chart(chart, "E5")  # Adjust the position to place the chart in the sheet
+    # Replace any earlier chart rows in a single transaction
+    with transaction.atomic():
+        VisualizationData.objects.filter(optimization_data=optimization_data).delete()
+        VisualizationData.objects.bulk_create(rows)
+    return len(rows)
 
-    # Save the workbook with the chart
-    dashboard_file_path = file_path.replace('.xlsx', '_dashboard.xlsx')
-    wb.save(dashboard_file_path)
+def copy_charts(source, optimization_data):
+    """Give an upload its own copy of another upload's chart rows; returns how many were copied."""
+    rows = [
+        VisualizationData(optimization_data=optimization_data, chart_type=chart_type, resolution=resolution, data=data)
+        for chart_type, resolution, data in source.visualization.values_list('chart_type', 'resolution', 'data')
+    ]
+    with transaction.atomic():
+        VisualizationData.objects.filter(optimization_data=optimization_data).delete()
+        VisualizationData.objects.bulk_create(rows)
+    return len(rows)
 
-    return analysis_result, dashboard_file_path
+async def achart_for_width(optimization_data, chart_type, width=None):
+    """Smallest precomputed level with at least `width` points, else full resolution."""
+    charts = VisualizationData.objects.filter(optimization_data=optimization_data, chart_type=chart_type)
+    if width:
+        level = await charts.filter(resolution__gte=width).order_by('resolution').afirst()
+        if level is not None:
+            return level
+    return await charts.filter(resolution__isnull=True).afirst()
@@ -0,0 +1,81 @@
+import duckdb
+
+from .analytics import CUBE_DIMENSIONS
+from .ingest import load_table, sidecar_path
+from .models import OptimizationData
+
+PARENT_CANDIDATES = 20  # Most recent earlier uploads considered when looking for the superseded version
+
+
+def find_parent(optimization_data):
+    """The earlier upload this one is a revision of, or None.
+
+    A revision has the same columns as the user's earlier upload; uploads
+    with the same file name are preferred over other same-layout files.
+    """
+    columns = load_table(optimization_data).column_names
+    candidates = (
+        OptimizationData.objects
+        .filter(user=optimization_data.user, id__lt=optimization_data.id)
+        .exclude(content_hash__in=['', optimization_data.content_hash])
+        .order_by('-id')[:PARENT_CANDIDATES]
+    )
+    same_layout = [
+        candidate for candidate in candidates
+        if sidecar_path(candidate) and load_table(candidate).column_names == columns
+    ]
+    same_name = [candidate for candidate in same_layout if candidate.display_name == optimization_data.display_name]
+    return (same_name or same_layout or [None])[0]
+
+
+def partition_digests(table, keys):
+    """{partition key values: (rows, digest)} for each group of `keys` in the table.
+
+    The digest is an order-insensitive sum of row hashes, so a partition only
+    differs when its rows do.
+    """
+    con = duckdb.connect()
+    try:
+        con.register('source', table)
+        key_columns = ', '.join(f'CAST("{key}" AS VARCHAR)' for key in keys)
+        row = ', '.join(f'"{column}"' for column in table.column_names)
+        result = con.execute(f"""
+            SELECT {key_columns}, COUNT(*), SUM(hash({row})::HUGEINT)
+            FROM source
+            GROUP BY ALL
+            """).fetchall()
+    finally:
+        con.close()
+    return {tuple(values[:-2]): (values[-2], int(values[-1])) for values in result}
+
+
+def diff_tables(old, new):
+    """Partition-level diff of two versions of a workbook, keyed by the cube dimensions.
+
+    Sheets without those columns only report row counts, and everything
+    derived from them is rebuilt.
+    """
+    changes = {'rows': {'before': old.num_rows, 'after': new.num_rows}, 'keys': []}
+    if not set(CUBE_DIMENSIONS) <= set(new.column_names):
+        return changes
+
+    keys = list(CUBE_DIMENSIONS)
+    before, after = partition_digests(old, keys), partition_digests(new, keys)
+    changes.update({
+        'keys': keys,
+        'added': [list(key) for key in after.keys() - before.keys()],
+        'removed': [list(key) for key in before.keys() - after.keys()],
+        'changed': [list(key) for key in after.keys() & before.keys() if after[key] != before[key]],
+        'unchanged': sum(1 for key in after.keys() & before.keys() if after[key] == before[key]),
+    })
+    return changes
+
+
+def link_version(optimization_data):
+    """Record which upload this one supersedes and what changed since it."""
+    parent = find_parent(optimization_data)
+    optimization_data.parent = parent
+    optimization_data.version = parent.version + 1 if parent else 1
+    optimization_data.changes = diff_tables(load_table(parent), load_table(optimization_data)) if parent else {}
+    optimization_data.save(update_fields=['parent', 'version', 'changes'])
+    return parent
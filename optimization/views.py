@@ -1,15 +1,39 @@
-from django.shortcuts import render, get_object_or_404,redirect
-from django.http import JsonResponse
+from django.shortcuts import render, get_object_or_404,redirect, aget_object_or_404
+from django.views.decorators.http import require_GET, require_POST, require_http_methods
+from django.http import FileResponse, Http404, JsonResponse, StreamingHttpResponse
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.urls import reverse
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate, login as auth_login
 from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from asgiref.sync import sync_to_async
 from .models import Subscription
 from .models import OptimizationData
 from django.contrib.auth.decorators import login_required
-import pandas as pd
-import subprocess
 from django.contrib.auth import logout
-from .models import OptimizationData, VisualizationData
+from .models import OptimizationData, ProcessingJob, UploadSession
+from .solver import clean_params
+from .sweeps import expand_grid, sweep, table_scenarios
+from .analytics import CUBE_DIMENSIONS, ALL_MONTHS
+from .jobs import enqueue
+from .dashboard import dashboard_context
+from .entitlements import QuotaExceeded, check_queue, check_upload, check_upload_request, sweep_limits
+from .ingest import load_table, sidecar_path
+from .uploads import (
+    CHUNK_FIELDS, UploadConflict, UploadError, append_chunk, discard_session, finish_session, session_lock, store_upload,
+    upload_format,
+)
+from .blocking import iterate_blocking, run_blocking
+from .streamlit_pool import route, worker_url
+from .http import compressed
+from .utils import achart_for_width, dashboard_token, generate_excel_dashboard
+from urllib.parse import urlencode
+import asyncio
+import json
+import re
 
 
 def home(request):
@@ -125,125 +149,419 @@ def subscription_payment(request):
     
 @login_required
 def dashboard(request, user_id=None):
-    # If user_id is passed, retrieve that user's data, else use logged-in user
-    if user_id:
-        user = User.objects.get(id=user_id)
-    else:
-        user = request.user
-
-    try:
-        subscription = Subscription.objects.get(user=user)
-    except Subscription.DoesNotExist:
-        subscription = None
-    
-    analysis_count = OptimizationData.objects.filter(user=user).count()  # Adjust based on your model
-
-    context = {
-        'user': user,
-        'subscription': subscription,
-        'analysis_count': analysis_count,
-    }
-    
-    return render(request, 'dashboard.html', context)
+    # Users only see their own dashboard; anyone else's id is a 404 rather than their cached context
+    if user_id not in (None, request.user.id):
+        raise Http404('No such dashboard')
+    return render(request, 'dashboard.html', {'user': request.user, **dashboard_context(request.user.id)})
 
 @login_required
-def upload_excel(request):
-    """Upload and process the Excel file."""
+async def upload_excel(request):
+    """Upload and process an Excel, CSV (optionally gzipped) or Parquet file."""
     if request.method == 'POST':
-        uploaded_file = request.FILES['file']
-        
-        # Create an OptimizationData instance
-        optimization_data = OptimizationData(user=request.user, file=uploaded_file)
-        optimization_data.save()
-
-        # Read the uploaded Excel file into a DataFrame
-        df = pd.read_excel(optimization_data.file.path)
+        user = await request.auser()
+        # Refuse an oversized body before request.FILES spools all of it to disk
+        try:
+            content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            content_length = 0
+        try:
+            await sync_to_async(check_upload_request)(user.id, content_length)
+        except QuotaExceeded as e:
+            return JsonResponse({'status': 'error', 'errors': {'file': str(e)}}, status=e.status)
+
+        # Multipart parsing hashes and spools the file to disk, so it runs off the event loop
+        files = await run_blocking(lambda: request.FILES)
+        uploaded_file = files['file']
+
+        # Trust the file's leading bytes rather than its name
+        if await run_blocking(upload_format, uploaded_file) is None:
+            return JsonResponse({'status': 'error', 'errors': {'file': 'Upload an .xlsx, .csv, .csv.gz or .parquet file'}}, status=400)
+        try:
+            # The declared length can't be trusted, so the parsed file is checked too
+            await sync_to_async(check_upload)(user.id, uploaded_file.size)
+        except QuotaExceeded as e:
+            return JsonResponse({'status': 'error', 'errors': {'file': str(e)}}, status=e.status)
+
+        # Identical bytes are stored once; the job then reuses their parsed data and charts
+        name, content_hash = await run_blocking(store_upload, uploaded_file)
+        optimization_data = await OptimizationData.objects.acreate(
+            user=user, file=name, original_name=uploaded_file.name, content_hash=content_hash,
+        )
 
-        # Optional: Process your DataFrame here
-        # Example: Converting specific columns to numeric if needed
-        if 'column1' in df.columns and 'column2' in df.columns:
-            df['column1'] = pd.to_numeric(df['column1'], errors='coerce')
-            df['column2'] = pd.to_numeric(df['column2'], errors='coerce')
+        # Parsing and chart precompute happen in the background job queue
+        job = await sync_to_async(enqueue)(optimization_data)
 
-            # Example operation
-            if not df['column1'].isnull().all() and not df['column2'].isnull().all():
-                df['result'] = df['column1'] - df['column2']
-                # Save the result or process it as needed
+        if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+            return _job_accepted(job)
 
         return redirect('excel_dashboard')  # Redirect to the Excel dashboard page
 
-    return render(request, 'dashboard.html')
+    return await sync_to_async(render)(request, 'dashboard.html')
+
+def _job_accepted(job):
+    return JsonResponse({
+        'status': job.status,
+        'job_id': job.id,
+        'status_url': reverse('job_status', args=[job.id]),
+    }, status=202)
+
+def _session_response(session, status=200):
+    data = session.to_dict()
+    data['url'] = reverse('upload_session', args=[session.id])
+    data['complete_url'] = reverse('complete_upload_session', args=[session.id])
+    return JsonResponse(data, status=status)
+
+async def _fail_session(session, error):
+    await run_blocking(discard_session, session)
+    session.status = 'failed'
+    session.error = str(error)
+    await session.asave(update_fields=['status', 'error', 'updated_at'])
+    return JsonResponse({'status': 'error', 'errors': {'file': str(error)}}, status=400)
+
+async def _complete_session(session):
+    """Move a fully received session into storage and queue its processing job."""
+    try:
+        await sync_to_async(check_queue)(session.user_id)
+    except QuotaExceeded as e:
+        # The session stays open with every byte received; the client completes it once a job finishes
+        return JsonResponse({'status': 'error', 'errors': {'file': str(e)}}, status=e.status)
+    try:
+        # Validates the structure and, without a saved digest, hashes the file
+        name, content_hash = await run_blocking(finish_session, session)
+    except UploadError as e:
+        return await _fail_session(session, e)
+
+    optimization_data = await OptimizationData.objects.acreate(
+        user_id=session.user_id, file=name, original_name=session.filename, content_hash=content_hash,
+    )
+    session.status = 'complete'
+    session.optimization_data = optimization_data
+    await session.asave(update_fields=['status', 'optimization_data', 'updated_at'])
+    return _job_accepted(await sync_to_async(enqueue)(optimization_data))
+
+async def _latest_job(session):
+    return await ProcessingJob.objects.filter(optimization_data_id=session.optimization_data_id).alatest('created_at')
 
 @login_required
-def process_excel_file(optimization_data):
-    """Process the Excel file and save data for visualizations."""
-    file_path = optimization_data.file.path
-    df = pd.read_excel(file_path)
+@require_POST
+async def create_upload_session(request):
+    """Start a chunked upload. Expects JSON {"filename": ..., "size": <bytes>}."""
+    try:
+        body = json.loads(request.body)
+        filename, size = str(body['filename']), int(body['size'])
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'status': 'error', 'errors': {'form': 'filename and size are required'}}, status=400)
+    if size <= 0:
+        return JsonResponse({'status': 'error', 'errors': {'size': 'Size must be positive'}}, status=400)
+    user = await request.auser()
+    try:
+        await sync_to_async(check_upload)(user.id, size)
+    except QuotaExceeded as e:
+        return JsonResponse({'status': 'error', 'errors': {'size': str(e)}}, status=e.status)
 
-    # Convert datetime columns to string format
-    for column in df.select_dtypes(include=['datetime64[ns]', 'datetime']):
-        df[column] = df[column].dt.strftime('%Y-%m-%d')  # Convert to string format
+    session = await UploadSession.objects.acreate(user=user, filename=filename, size=size)
+    response = _session_response(session, status=201)
+    response['Location'] = reverse('upload_session', args=[session.id])
+    return response
 
-    # Example processing for charts
-    line_data = df.iloc[:, 1].tolist()  # Assuming the first column for line chart
-    bar_data = df.iloc[:, 2].tolist()    # Assuming the second column for bar chart
-    pie_data = df.iloc[:, 3].value_counts().to_dict()  # Assuming the third column for pie chart
+@login_required
+@require_http_methods(['GET', 'PUT'])
+async def upload_session(request, session_id):
+    """GET reports how many bytes have arrived; PUT appends the next chunk.
+
+    Chunks must start where the last one ended (Content-Range: bytes start-end/size).
+    A mismatched start returns 409 with the current offset so clients resume
+    from there. The job is queued as soon as the last byte lands.
+    """
+    session = await aget_object_or_404(UploadSession, id=session_id, user=await request.auser())
+    if request.method == 'GET' or session.status != 'open':
+        return _session_response(session)
+
+    match = re.match(r'bytes (\d+)-\d+/\d+$', request.headers.get('Content-Range', ''))
+    try:
+        # Concurrent PUTs for the same offset would interleave writes; the loser gets a 409
+        with session_lock(session):
+            await session.arefresh_from_db()
+            start = int(match.group(1)) if match else session.received
+            if session.status != 'open' or start != session.received:
+                return _session_response(session, status=409)
+
+            # Reading the body and writing it to disk run in the blocking pool
+            try:
+                await run_blocking(append_chunk, session, request)
+            except UploadError as e:
+                return await _fail_session(session, e)
+            await session.asave(update_fields=CHUNK_FIELDS)
+
+            if session.received == session.size:
+                return await _complete_session(session)
+    except UploadConflict:
+        return _session_response(session, status=409)
+    return _session_response(session)
+
+@login_required
+@require_POST
+async def complete_upload_session(request, session_id):
+    """Explicitly finish a session; a no-op if its last chunk already queued the job."""
+    session = await aget_object_or_404(UploadSession, id=session_id, user=await request.auser())
+    if session.status == 'complete':
+        return _job_accepted(await _latest_job(session))
+    if session.status != 'open' or session.received != session.size:
+        return _session_response(session, status=409)
+    try:
+        with session_lock(session):
+            await session.arefresh_from_db()
+            if session.status == 'complete':
+                return _job_accepted(await _latest_job(session))
+            if session.status != 'open' or session.received != session.size:
+                return _session_response(session, status=409)
+            return await _complete_session(session)
+    except UploadConflict:
+        return _session_response(session, status=409)
+
+def _processing_jobs(optimization_data):
+    """The upload's processing jobs, newest first."""
+    return optimization_data.jobs.filter(kind='process').order_by('-created_at', '-id')
 
-    # Column chart data (assuming you want to use the first two columns)
-    column_data_labels = df.iloc[:, 1].tolist()  # First column as labels
-    column_data_values = df.iloc[:, 2].tolist()  # Second column as values
+@login_required
+def excel_dashboard(request, upload_id=None):
+    uploads = OptimizationData.objects.filter(user=request.user)
+    if upload_id is None:
+        optimization_data = uploads.order_by('-upload_date', '-id').first()
+    else:
+        optimization_data = get_object_or_404(uploads, id=upload_id)
+    job = optimization_data and _processing_jobs(optimization_data).first()
+
+    # Route to a pooled Streamlit worker (started by `manage.py run_streamlit_pool`),
+    # but only once the upload's data is ready for it
+    worker = None if job and job.status in ('queued', 'running') else route(request)
+    if worker is None:
+        # The page follows the progress stream and embeds the dashboard when it is ready
+        events_url = reverse('dashboard_events', args=[optimization_data.id]) if optimization_data else reverse('dashboard_events')
+        return render(request, "excel_dashboard.html", {'events_url': events_url, 'job': job})
+
+    # Render the Django template; the token scopes the dashboard to this user
+    streamlit_url = f"{worker_url(worker)}?{urlencode({'token': dashboard_token(request.user)})}"
+    return render(request, "excel_dashboard.html", {'streamlit_url': streamlit_url})
+
+def _event(name, data):
+    return f'event: {name}\ndata: {json.dumps(data)}\n\n'
+
+async def _dashboard_events(request, optimization_data, duration):
+    """Yield the upload's processing progress, then the dashboard URL once data and a worker are ready.
+
+    The stream closes after `duration` seconds; the browser's EventSource then
+    reconnects after the `retry` delay sent up front and carries on.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + duration
+    yield f'retry: {int(settings.JOB_POLL_INTERVAL * 1000)}\n\n'
+    state = None
+    last_sent = loop.time()
+    while True:
+        job = optimization_data and await _processing_jobs(optimization_data).afirst()
+        if job is not None and job.to_dict() != state:
+            state = job.to_dict()
+            last_sent = loop.time()
+            yield _event('progress', state)
+
+        if job is None or job.status in ('done', 'failed'):
+            worker = await sync_to_async(route)(request)
+            if worker is not None:
+                # The session middleware saved before the stream started, so keep the routing sticky here
+                await sync_to_async(request.session.save)()
+                user = await request.auser()
+                yield _event('ready', {'url': f"{worker_url(worker)}?{urlencode({'token': dashboard_token(user)})}"})
+                return
+
+        if loop.time() >= deadline:
+            return  # Also bounds the wait for a healthy Streamlit worker
+        if loop.time() - last_sent >= settings.DASHBOARD_EVENTS_KEEPALIVE:
+            last_sent = loop.time()
+            yield ': keepalive\n\n'  # Comment line; keeps proxies from closing an idle stream
+        await asyncio.sleep(min(settings.JOB_POLL_INTERVAL, deadline - loop.time()))
 
-    # Create Pareto chart data (frequency + cumulative percentage)
-    value_counts = df.iloc[:, 1].value_counts().sort_index()  # Frequency
-    pareto_data = value_counts.cumsum() / value_counts.sum() * 100  # Cumulative percentage
-    pareto_labels = value_counts.index.tolist()  # Labels for Pareto chart (x-axis)
+@login_required
+@require_GET
+async def dashboard_events(request, upload_id=None):
+    """Server-sent events for the Excel dashboard page (the user's latest upload by default).
+
+    `progress` carries the processing job (its `progress` field has bytes
+    received, rows parsed, sheets done and charts precomputed); `ready` carries
+    the Streamlit URL to embed and ends the stream.
+
+    Under ASGI the stream stays open for up to DASHBOARD_EVENTS_MAX_DURATION.
+    WSGI buffers an async stream until it ends, so there each request sends
+    the current state and closes, and the browser reconnects every
+    JOB_POLL_INTERVAL.
+    """
+    user = await request.auser()
+    uploads = OptimizationData.objects.filter(user=user)
+    if upload_id is None:
+        optimization_data = await uploads.order_by('-upload_date', '-id').afirst()
+    else:
+        optimization_data = await aget_object_or_404(uploads, id=upload_id)
 
-    # Waterfall chart data (manually calculated increments)
+    duration = settings.DASHBOARD_EVENTS_MAX_DURATION if isinstance(request, ASGIRequest) else 0
+    response = StreamingHttpResponse(_dashboard_events(request, optimization_data, duration), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Stop nginx from buffering the stream
+    return response
 
+@login_required
+async def job_status(request, job_id):
+    """Polling endpoint for background processing jobs.
+
+    With ?wait=<seconds>, an unfinished job is long-polled: the response is
+    held until the job's state changes or the wait runs out.
+    """
+    user = await request.auser()
+    job = await aget_object_or_404(ProcessingJob, id=job_id, optimization_data__user=user)
+    state = job.to_dict()
+    try:
+        wait = min(float(request.GET.get('wait', 0)), settings.JOB_LONG_POLL_TIMEOUT)
+    except ValueError:
+        wait = 0
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + wait
+    while state['status'] in ('queued', 'running') and loop.time() < deadline:
+        await asyncio.sleep(min(settings.JOB_POLL_INTERVAL, deadline - loop.time()))
+        job = await ProcessingJob.objects.aget(id=job.id)
+        if job.to_dict() != state:
+            state = job.to_dict()
+            break
+    return JsonResponse(state)
 
-    # Save processed data in the VisualizationData model
-    VisualizationData.objects.create(
-        optimization_data=optimization_data,
-        chart_type='line',
-        data={'labels': list(range(len(line_data))), 'values': line_data}
-    )
+@login_required
+@require_POST
+def optimize_upload(request, upload_id):
+    """Queue a product-mix / price-point optimisation. Optional JSON body overrides solver.DEFAULT_PARAMS."""
+    optimization_data = get_object_or_404(OptimizationData, id=upload_id, user=request.user)
+    try:
+        params = json.loads(request.body or '{}')
+        if not isinstance(params, dict):
+            raise ValueError('Parameters must be a JSON object')
+        clean_params(params)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'errors': {'params': str(e)}}, status=400)
+    try:
+        check_queue(request.user.id)
+    except QuotaExceeded as e:
+        return JsonResponse({'status': 'error', 'errors': {'params': str(e)}}, status=e.status)
+    return _job_accepted(enqueue(optimization_data, kind='optimize', params=params))
 
-    VisualizationData.objects.create(
-        optimization_data=optimization_data,
-        chart_type='bar',
-        data={'labels': list(range(len(bar_data))), 'values': bar_data}
-    )
+@login_required
+@require_GET
+def optimization_results(request, upload_id):
+    optimization_data = get_object_or_404(OptimizationData, id=upload_id, user=request.user)
+    results = optimization_data.results.order_by('-created_at')
+    return JsonResponse({'upload_id': optimization_data.id, 'results': [result.to_dict() for result in results]})
 
-    VisualizationData.objects.create(
-        optimization_data=optimization_data,
-        chart_type='pie',
-        data={'labels': list(pie_data.keys()), 'values': list(pie_data.values())}
-    )
+@login_required
+@require_POST
+async def scenario_sweep(request, upload_id):
+    """Run the optimiser over a parameter grid, streaming one NDJSON line per finished scenario.
+
+    Body: {"grid": {"elasticity": [-1, -1.5], "budget": [...], ...}}. Every
+    scenario in the upload is swept unless the grid lists some.
+    """
+    user = await request.auser()
+    optimization_data = await aget_object_or_404(OptimizationData, id=upload_id, user=user)
+    table = await sync_to_async(load_table)(optimization_data)  # Ingests (and saves) uploads not parsed yet
+    if not set(CUBE_DIMENSIONS + tuple(ALL_MONTHS)) <= set(table.column_names):
+        return JsonResponse({'status': 'error', 'errors': {'file': 'This upload has no Scenario/business_unit/Account/Year/month columns'}}, status=400)
+
+    # The grid size and the pool processes it may use at once are capped by the user's plan
+    max_scenarios, workers = await sync_to_async(sweep_limits)(user.id)
+    try:
+        body = json.loads(request.body or '{}')
+        scenarios = expand_grid(body.get('grid', {}), table_scenarios(table), max_scenarios)
+    except (ValueError, AttributeError) as e:
+        return JsonResponse({'status': 'error', 'errors': {'grid': str(e)}}, status=400)
+
+    # Each result is sent as its scenario finishes; waiting for the next one happens off the event loop
+    results = sweep(sidecar_path(optimization_data), scenarios, workers)
+    lines = iterate_blocking(json.dumps(result) + '\n' for result in results)
+    response = StreamingHttpResponse(lines, content_type='application/x-ndjson')
+    response['X-Scenario-Count'] = str(len(scenarios))
+    return response
 
-    # Column chart
-    VisualizationData.objects.create(
-        optimization_data=optimization_data,
-        chart_type='column',
-        data={'labels': column_data_labels, 'values': column_data_values}
-    )
+@login_required
+@require_GET
+def export_dashboard(request, upload_id):
+    """Download the upload as an .xlsx with a summary sheet; built once per file content."""
+    optimization_data = get_object_or_404(OptimizationData, id=upload_id, user=request.user)
+    _, path = generate_excel_dashboard(optimization_data)
+    stem = optimization_data.display_name.split('.')[0]
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=f'{stem}_dashboard.xlsx')
+
+async def _requested_chart(request, upload_id, chart_type):
+    """The chart row for this upload at the resolution that fits ?width=, or None."""
+    user = await request.auser()
+    optimization_data = await aget_object_or_404(OptimizationData, id=upload_id, user=user)
+    try:
+        width = int(request.GET.get('width', 0))
+    except ValueError:
+        width = 0
+    return await achart_for_width(optimization_data, chart_type, width)
+
+def _chart_response(chart):
+    return JsonResponse({
+        'chart_type': chart.chart_type,
+        'resolution': chart.resolution,
+        'data': chart.payload(),
+    })
 
-    # Pareto chart (frequency + cumulative percentage)
-    VisualizationData.objects.create(
-        optimization_data=optimization_data,
-        chart_type='pareto',
-        data={
-            'labels': pareto_labels,  # X-axis labels
-            'frequency_values': value_counts.tolist(),  # Bar data
-            'cumulative_values': pareto_data.tolist()  # Line data (cumulative percentage)
-        }
-    )
-  
+@login_required
+@require_GET
+def chart_types(request, upload_id):
+    """List the precomputed charts available for an upload."""
+    optimization_data = get_object_or_404(OptimizationData, id=upload_id, user=request.user)
+    charts = optimization_data.visualization.filter(resolution__isnull=True).values_list('chart_type', flat=True)
+    levels = optimization_data.visualization.exclude(resolution__isnull=True).values_list('chart_type', 'resolution')
+    resolutions = {}
+    for chart_type, resolution in levels:
+        resolutions.setdefault(chart_type, []).append(resolution)
+    return JsonResponse({
+        'upload_id': optimization_data.id,
+        'charts': [
+            {
+                'chart_type': chart_type,
+                'resolutions': sorted(resolutions.get(chart_type, [])),
+                'url': reverse('chart_data', args=[optimization_data.id, chart_type]),
+            }
+            for chart_type in charts
+        ],
+    })
 
 @login_required
-def excel_dashboard(request):
-    # Start the Streamlit app in the background
-    subprocess.Popen(["streamlit", "run", "path/to/your/streamlit_app.py", "--server.port", "8501"], 
-                     stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+@require_GET
+@compressed
+async def chart_data(request, upload_id, chart_type):
+    """Precomputed chart payload; pass ?width=<pixels> to get a downsampled level."""
+    chart = await _requested_chart(request, upload_id, chart_type)
+    if chart is None:
+        return JsonResponse({'status': 'error', 'message': 'Chart not found'}, status=404)
+
+    # Conditional GET by hand: one chart lookup serves the ETag, Last-Modified and body
+    etag = quote_etag(f'{chart.pk}-{chart.updated_at.timestamp()}')
+    last_modified = int(chart.updated_at.timestamp())
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        # Decoding and serialising a full-resolution series is CPU work
+        response = await run_blocking(_chart_response, chart)
+    response.headers.setdefault('ETag', etag)
+    response.headers.setdefault('Last-Modified', http_date(last_modified))
+    response['Cache-Control'] = 'private, no-cache'  # Always revalidate; the ETag makes that cheap
+    return response
 
-    # Render the Django template
-    return render(request, "excel_dashboard.html")
\ No newline at end of file
+@login_required
+def chart_dashboard(request, upload_id=None):
+    """In-page Chart.js dashboard for an upload (the user's latest by default)."""
+    uploads = OptimizationData.objects.filter(user=request.user)
+    if upload_id is None:
+        optimization_data = uploads.order_by('-upload_date', '-id').first()
+    else:
+        optimization_data = get_object_or_404(uploads, id=upload_id)
+    return render(request, 'chart_dashboard.html', {'optimization_data': optimization_data})
@@ -3,6 +3,14 @@ ASGI config for product_optimization project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+This is how the site is deployed, e.g.
+
+    uvicorn product_optimization.asgi:application --workers 4
+
+The upload, job-status and chart views are async and the Excel dashboard's
+progress stream is pushed as it happens, neither of which works under WSGI:
+there, the progress stream degrades to one snapshot per reconnect.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
@@ -73,6 +73,9 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'product_optimization.wsgi.application'
+# Serve through the ASGI application in production (see asgi.py): the async upload,
+# long-poll and progress-stream views only hold connections cheaply under ASGI
+ASGI_APPLICATION = 'product_optimization.asgi.application'
 
 
 # Database
@@ -82,6 +85,34 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Keep connections between requests instead of reopening SQLite every time
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Run on every new connection. WAL lets readers work alongside the upload
+            # and job writers; busy_timeout waits for the write lock instead of failing
+            # with "database is locked".
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                'PRAGMA mmap_size=268435456;'
+                'PRAGMA cache_size=-65536;'
+                'PRAGMA busy_timeout=5000;'
+            ),
+            # Take the write lock when a transaction starts, so two writers queue up
+            # rather than deadlock upgrading their read locks
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+    }
+}
+
+
+# File-based so every web, job and Streamlit process shares entries and invalidations
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / '.cache',
     }
 }
 
@@ -126,6 +157,69 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Hash uploads while they stream in so identical files are stored and parsed once
+FILE_UPLOAD_HANDLERS = [
+    'optimization.uploads.HashingMemoryFileUploadHandler',
+    'optimization.uploads.HashingTemporaryFileUploadHandler',
+]
+
+# Rows per chunk when streaming workbooks into the columnar cache
+INGEST_CHUNK_ROWS = 50_000
+# Processes used to parse the sheets of one workbook in parallel
+INGEST_WORKERS = os.cpu_count() or 1
+
+# Per-upload DuckDB databases used by the dashboards, relative to MEDIA_ROOT
+ANALYTICS_DIR = 'analytics'
+
+# Scenario sweeps: processes in the pool every sweep shares (also the most scenarios
+# one sweep runs at once, for any tier) and largest grid for any tier
+SWEEP_WORKERS = os.cpu_count() or 1
+SWEEP_MAX_SCENARIOS = 500
+
+# Memory budget for parsed DataFrames cached by each Streamlit process
+STREAMLIT_FRAME_CACHE_BYTES = 512 * 1024 * 1024
+
+# Streamlit dashboard worker pool (python manage.py run_streamlit_pool)
+STREAMLIT_HOST = 'localhost'
+STREAMLIT_BASE_PORT = 8501
+STREAMLIT_POOL_SIZE = 4
+STREAMLIT_POOL_MIN = 1  # Workers kept running even when idle
+STREAMLIT_IDLE_TIMEOUT = 15 * 60  # Seconds without routed sessions before a worker is stopped
+STREAMLIT_START_TIMEOUT = 60  # Seconds a starting worker has to pass its first health check
+STREAMLIT_HEALTH_INTERVAL = 5  # Seconds between supervision passes
+
+# Background job queue (python manage.py process_jobs)
+JOB_WORKERS = 2
+JOB_POLL_INTERVAL = 1.0
+JOB_STALE_AFTER = 60 * 60  # Seconds before a running job is assumed dead and requeued
+JOB_LONG_POLL_TIMEOUT = 30  # Longest ?wait= the job status endpoint holds a request open
+DASHBOARD_EVENTS_KEEPALIVE = 15  # Seconds between keepalive comments on an idle progress stream
+DASHBOARD_EVENTS_MAX_DURATION = 5 * 60  # Seconds a progress stream stays open before the browser reconnects
+
+# Threads async views use for disk writes, upload parsing and response encoding
+ASYNC_BLOCKING_WORKERS = 32
+
+# Limits per subscription tier (users without an active plan get 'free'):
+# jobs running at once, jobs queued or running at once, upload size, queue
+# priority (higher is claimed first, so paid jobs never wait behind free ones),
+# and scenarios / processes per sweep (also capped by the SWEEP_* settings)
+ENTITLEMENT_TIERS = {
+    'free': {
+        'max_running_jobs': 1, 'max_queued_jobs': 5, 'max_upload_bytes': 25 * 1024 * 1024, 'priority': 0,
+        'max_sweep_scenarios': 50, 'max_sweep_workers': 1,
+    },
+    'monthly': {
+        'max_running_jobs': 2, 'max_queued_jobs': 50, 'max_upload_bytes': 250 * 1024 * 1024, 'priority': 10,
+        'max_sweep_scenarios': 200, 'max_sweep_workers': 2,
+    },
+    'yearly': {
+        'max_running_jobs': 4, 'max_queued_jobs': 100, 'max_upload_bytes': 1024 * 1024 * 1024, 'priority': 20,
+        'max_sweep_scenarios': 500, 'max_sweep_workers': 4,
+    },
+}
+ENTITLEMENT_CACHE_TIMEOUT = 300  # Seconds
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 